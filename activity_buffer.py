@@ -0,0 +1,194 @@
+"""
+Буфер отложенной записи активности чатов
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from config import ACTIVITY_FLUSH_INTERVAL, ACTIVITY_FLUSH_MAX_SIZE, ACTIVITY_FLUSH_MAX_ATTEMPTS
+from database import Database, hour_bucket
+
+logger = logging.getLogger(__name__)
+
+class ActivityBuffer:
+    """Накапливает активность в памяти и сбрасывает её в БД пакетами"""
+    
+    def __init__(self, db: Database, flush_interval: float = ACTIVITY_FLUSH_INTERVAL,
+                 max_size: int = ACTIVITY_FLUSH_MAX_SIZE, max_attempts: int = ACTIVITY_FLUSH_MAX_ATTEMPTS):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        
+        # (chat_id, user_id) -> [количество сообщений, дата последнего сообщения]
+        self._activity: Dict[Tuple[int, int], list] = {}
+        # chat_id -> дата последней активности
+        self._chat_dates: Dict[int, str] = {}
+        # (chat_id, номер часа, user_id) -> количество сообщений
+        self._buckets: Dict[Tuple[int, int, int], int] = {}
+        # Пакет (activity, chat_dates, buckets), который не удалось записать, и число попыток
+        self._retry: Optional[Tuple[Dict, Dict, Dict]] = None
+        self._retry_attempts = 0
+        
+        self._flush_lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        
+        # Метрики
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped_batches = 0
+        self.dropped_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+    
+    @property
+    def depth(self) -> int:
+        """Количество пар (чат, пользователь), ожидающих записи"""
+        return len(self._activity)
+    
+    def record(self, chat_id: int, user_id: int, moment: datetime = None):
+        """Учет одного сообщения (без обращения к БД)"""
+        moment = moment or datetime.now()
+        date = moment.isoformat()
+        
+        entry = self._activity.get((chat_id, user_id))
+        if entry is None:
+            self._activity[(chat_id, user_id)] = [1, date]
+        else:
+            entry[0] += 1
+            entry[1] = max(entry[1], date)
+        
+        if date > self._chat_dates.get(chat_id, ''):
+            self._chat_dates[chat_id] = date
+        
+        bucket_key = (chat_id, hour_bucket(moment), user_id)
+        self._buckets[bucket_key] = self._buckets.get(bucket_key, 0) + 1
+        
+        if len(self._activity) >= self.max_size:
+            self._flush_event.set()
+    
+    async def flush(self) -> int:
+        """
+        Запись накопленной активности одной транзакцией; возвращает число записанных пар
+        
+        Пакет, который не удалось записать, повторяется при следующих сбросах раньше новых
+        данных (они ждут в буфере, чтобы не записать их до более старого пакета). После
+        max_attempts неудачных попыток пакет отбрасывается с записью в журнал ошибок, чтобы
+        пакет с неустранимой ошибкой не блокировал сброс навсегда.
+        """
+        async with self._flush_lock:
+            written = 0
+            if self._retry is not None:
+                rows = len(self._retry[0])
+                if await self._apply(*self._retry):
+                    self._retry = None
+                    self._retry_attempts = 0
+                    written += rows
+                else:
+                    self._record_failure()
+                    if self._retry is not None:
+                        return 0
+            if not self._activity and not self._chat_dates:
+                return written
+            
+            batch = (self._activity, self._chat_dates, self._buckets)
+            self._activity, self._chat_dates, self._buckets = {}, {}, {}
+            if not await self._apply(*batch):
+                self._retry = batch
+                self._record_failure()
+                return written
+            return written + len(batch[0])
+    
+    async def _apply(self, activity: Dict[Tuple[int, int], list], chat_dates: Dict[int, str],
+                     buckets: Dict[Tuple[int, int, int], int]) -> bool:
+        """Запись пакета и учет метрик сброса"""
+        start = time.perf_counter()
+        success = await self.db.apply_activity_batch(
+            [(chat_id, user_id, count, date) for (chat_id, user_id), (count, date) in activity.items()],
+            [(date, chat_id) for chat_id, date in chat_dates.items()],
+            [(chat_id, hour, user_id, count) for (chat_id, hour, user_id), count in buckets.items()]
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        if not success:
+            self.failed_flushes += 1
+            return False
+        
+        self.flush_count += 1
+        self.flushed_rows += len(activity)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        logger.debug("Сброшено %s записей активности за %.1f мс", len(activity), elapsed_ms)
+        return True
+    
+    def _record_failure(self):
+        """Учет неудачной попытки записи пакета и его отбрасывание после max_attempts попыток"""
+        self._retry_attempts += 1
+        if self._retry_attempts < self.max_attempts:
+            logger.warning(f"Не удалось записать {len(self._retry[0])} записей активности "
+                           f"(попытка {self._retry_attempts} из {self.max_attempts}), повтор при следующем сбросе")
+            return
+        
+        rows = len(self._retry[0])
+        self.dropped_batches += 1
+        self.dropped_rows += rows
+        self._retry = None
+        self._retry_attempts = 0
+        logger.error(f"Пакет из {rows} записей активности не записан за {self.max_attempts} попыток и отброшен")
+    
+    async def _run(self):
+        """Фоновый цикл сброса по интервалу или по заполнению буфера"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сброса буфера активности: {e}")
+    
+    def start(self):
+        """Запуск фонового сброса"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановка фонового сброса с записью оставшихся данных"""
+        if self._task is not None:
+            self._stopping = True
+            self._flush_event.set()
+            await self._task
+            self._task = None
+        
+        await self.flush()
+        lost = self.depth + (len(self._retry[0]) if self._retry is not None else 0)
+        if lost:
+            logger.error(f"При остановке не записано {lost} записей активности")
+    
+    def get_metrics(self) -> Dict:
+        """Метрики буфера: глубина, задержка сброса, ожидающий повтора и отброшенные пакеты"""
+        return {
+            'buffer_depth': self.depth,
+            'flush_count': self.flush_count,
+            'flushed_rows': self.flushed_rows,
+            'failed_flushes': self.failed_flushes,
+            'retry_rows': len(self._retry[0]) if self._retry is not None else 0,
+            'retry_attempts': self._retry_attempts,
+            'dropped_batches': self.dropped_batches,
+            'dropped_rows': self.dropped_rows,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'max_flush_ms': round(self.max_flush_ms, 2),
+            'avg_flush_ms': round(self._total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0
+        }
@@ -0,0 +1,153 @@
+"""
+Скользящие окна активности чатов в памяти
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, Dict
+
+from config import ACTIVITY_WINDOW_HOURS
+from database import Database, hour_bucket
+
+logger = logging.getLogger(__name__)
+
+class _ChatWindow:
+    """Кольцевой буфер почасовых слотов одного чата"""
+    
+    __slots__ = ('slot_hours', 'slot_counts', 'slot_users', 'user_slots', 'total_messages', 'last_hour')
+    
+    def __init__(self, size: int):
+        self.slot_hours = [None] * size
+        self.slot_counts = [0] * size
+        self.slot_users = [None] * size
+        # user_id -> количество слотов окна, в которых пользователь писал
+        self.user_slots: Dict[int, int] = {}
+        self.total_messages = 0
+        self.last_hour = None
+    
+    def _expire(self, index: int):
+        """Освобождение слота с вычетом его данных из итогов окна"""
+        users = self.slot_users[index]
+        if users:
+            for user_id in users:
+                remaining = self.user_slots[user_id] - 1
+                if remaining:
+                    self.user_slots[user_id] = remaining
+                else:
+                    del self.user_slots[user_id]
+        self.total_messages -= self.slot_counts[index]
+        self.slot_hours[index] = None
+        self.slot_counts[index] = 0
+        self.slot_users[index] = None
+    
+    def advance(self, hour: int):
+        """Сдвиг окна до указанного часа с освобождением устаревших слотов"""
+        size = len(self.slot_hours)
+        if self.last_hour is not None and hour <= self.last_hour:
+            return
+        
+        if self.last_hour is None or hour - self.last_hour >= size:
+            start = hour - size + 1
+        else:
+            start = self.last_hour + 1
+        
+        for h in range(start, hour + 1):
+            if self.slot_hours[h % size] is not None:
+                self._expire(h % size)
+        self.last_hour = hour
+    
+    def add(self, hour: int, user_id: int, count: int = 1):
+        """Учет сообщений пользователя в слоте часа"""
+        size = len(self.slot_hours)
+        index = hour % size
+        if self.slot_hours[index] != hour:
+            if self.slot_hours[index] is not None:
+                self._expire(index)
+            self.slot_hours[index] = hour
+            self.slot_users[index] = set()
+        
+        users = self.slot_users[index]
+        if user_id not in users:
+            users.add(user_id)
+            self.user_slots[user_id] = self.user_slots.get(user_id, 0) + 1
+        
+        self.slot_counts[index] += count
+        self.total_messages += count
+
+class ActivityWindow:
+    """Статистика чатов за скользящее окно, обслуживаемая целиком из памяти"""
+    
+    def __init__(self, db: Database, hours: int = ACTIVITY_WINDOW_HOURS):
+        self.db = db
+        self.hours = hours
+        self._chats: Dict[int, _ChatWindow] = {}
+        # chat_id -> (member_count, value)
+        self._chat_info: Dict[int, tuple] = {}
+        self.loaded = False
+    
+    def record(self, chat_id: int, user_id: int, moment: datetime = None, count: int = 1):
+        """Учет сообщения за O(1)"""
+        hour = hour_bucket(moment)
+        window = self._chats.get(chat_id)
+        if window is None:
+            window = self._chats[chat_id] = _ChatWindow(self.hours)
+        
+        window.advance(hour)
+        # Сообщения старше окна (например, при загрузке) не учитываются
+        if hour > window.last_hour - self.hours:
+            window.add(hour, user_id, count)
+    
+    def set_chat_info(self, chat_id: int, member_count: int = None, value: float = None):
+        """Обновление сведений о чате, возвращаемых вместе со статистикой"""
+        current_members, current_value = self._chat_info.get(chat_id, (0, 0.0))
+        self._chat_info[chat_id] = (
+            current_members if member_count is None else member_count,
+            current_value if value is None else value
+        )
+    
+    def get_chat_stats(self, chat_id: int) -> Dict:
+        """Статистика чата за окно в формате Database.get_chat_stats"""
+        member_count, current_value = self._chat_info.get(chat_id, (0, 0.0))
+        window = self._chats.get(chat_id)
+        
+        if window is None:
+            active_users, total_messages = 0, 0
+        else:
+            window.advance(hour_bucket())
+            active_users, total_messages = len(window.user_slots), window.total_messages
+        
+        return {
+            'active_users': active_users,
+            'total_messages': total_messages,
+            'member_count': member_count,
+            'current_value': current_value
+        }
+    
+    async def load(self, chat_filter: Callable[[int], bool] = None):
+        """
+        Восстановление окон из почасовых корзин и таблицы чатов
+        
+        Args:
+            chat_filter: если указан, загружаются только чаты, для которых он возвращает True
+                (доля чатов рабочего процесса в многопроцессном режиме)
+        """
+        self._chats.clear()
+        self._chat_info.clear()
+        
+        for chat in await self.db.get_all_chats():
+            if chat_filter is None or chat_filter(chat['chat_id']):
+                self._chat_info[chat['chat_id']] = (chat['member_count'] or 0, chat['value'] or 0.0)
+        
+        current_hour = hour_bucket()
+        rows = await self.db.get_activity_buckets(current_hour - self.hours + 1)
+        if chat_filter is not None:
+            rows = [row for row in rows if chat_filter(row[0])]
+        for chat_id, hour, user_id, count in rows:
+            window = self._chats.get(chat_id)
+            if window is None:
+                window = self._chats[chat_id] = _ChatWindow(self.hours)
+                window.advance(current_hour)
+            window.add(hour, user_id, count)
+        
+        self.loaded = True
+        logger.info(f"Окна активности восстановлены: {len(self._chats)} чатов, {len(rows)} корзин")
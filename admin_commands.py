@@ -1,25 +1,29 @@
 import logging
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from aiogram import Bot, types
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from config import ADMIN_ID
+from config import ADMIN_ID, CHATS_PAGE_SIZE, ANALYZE_MAX_WINDOW_DAYS
 from database import Database
 from chat_analyzer import ChatAnalyzer
+from activity_buffer import ActivityBuffer
 
 logger = logging.getLogger(__name__)
 
 class AdminCommands:
     """Класс для обработки административных команд"""
     
-    def __init__(self, bot: Bot, db: Database, analyzer: ChatAnalyzer):
+    def __init__(self, bot: Bot, db: Database, analyzer: ChatAnalyzer,
+                 activity_buffer: Optional[ActivityBuffer] = None):
         self.bot = bot
         self.db = db
         self.analyzer = analyzer
+        self.activity_buffer = activity_buffer
     
     def is_admin(self, user_id: int) -> bool:
         """Проверка, является ли пользователь администратором"""
@@ -35,8 +39,7 @@ class AdminCommands:
             stats = await self.db.get_stats()
             
             # Получаем топ-5 чатов по ценности
-            all_chats = await self.db.get_all_chats()
-            top_chats = all_chats[:5]
+            top_chats = await self.db.get_top_chats(5)
             
             text = "📊 <b>Общая статистика бота</b>\n\n"
             text += f"👥 Всего пользователей: <b>{stats['total_users']}</b>\n"
@@ -59,6 +62,49 @@ class AdminCommands:
             logger.error(f"Ошибка получения статистики: {e}")
             await message.answer("❌ Ошибка получения статистики.")
     
+    def _parse_chats_callback(self, data: str) -> Dict:
+        """Разбор callback_data навигации по чатам: chats:<действие>[:<value>:<chat_id>]"""
+        parts = data.split(':')
+        if parts[0] != 'chats' or len(parts) != 4:
+            return {}
+        
+        key = (float(parts[2]), int(parts[3]))
+        if parts[1] == 'next':
+            return {'after': key}
+        if parts[1] == 'prev':
+            return {'before': key}
+        if parts[1] == 'refresh':
+            return {'start': key}
+        return {}
+    
+    def _render_chats_page(self, page: Dict):
+        """Текст и клавиатура страницы списка чатов"""
+        chats = page['chats']
+        text = "💬 <b>Список чатов</b>\n\n"
+        
+        for chat in chats:
+            date = datetime.fromisoformat(chat['added_date']).strftime("%d.%m.%Y")
+            last_activity = datetime.fromisoformat(chat['last_activity_date']).strftime("%d.%m %H:%M") if chat['last_activity_date'] else "Неизвестно"
+            
+            text += f"• <b>{chat['title']}</b>\n"
+            text += f"   💎 Ценность: {chat['value']:.2f}\n"
+            text += f"   👥 Участников: {chat['member_count']}\n"
+            text += f"   📅 Добавлен: {date}\n"
+            text += f"   🕐 Активность: {last_activity}\n\n"
+        
+        # Курсоры страниц - ключи (value, chat_id) первого и последнего чата
+        first = f"{chats[0]['value']!r}:{chats[0]['chat_id']}"
+        last = f"{chats[-1]['value']!r}:{chats[-1]['chat_id']}"
+        
+        builder = InlineKeyboardBuilder()
+        if page['has_prev']:
+            builder.add(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"chats:prev:{first}"))
+        builder.add(InlineKeyboardButton(text="🔄 Обновить", callback_data=f"chats:refresh:{first}"))
+        if page['has_next']:
+            builder.add(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"chats:next:{last}"))
+        
+        return text, builder.as_markup()
+    
     async def chats_command(self, message: Message):
         """Команда /chats - список чатов"""
         if not self.is_admin(message.from_user.id):
@@ -66,40 +112,49 @@ class AdminCommands:
             return
         
         try:
-            all_chats = await self.db.get_all_chats()
+            page = await self.db.get_chats_page(limit=CHATS_PAGE_SIZE)
             
-            if not all_chats:
+            if not page['chats']:
                 await message.answer("📭 Чатов пока нет.")
                 return
             
-            # Создаем клавиатуру для навигации
-            builder = InlineKeyboardBuilder()
-            builder.add(InlineKeyboardButton(
-                text="🔄 Обновить",
-                callback_data="refresh_chats"
-            ))
+            text, markup = self._render_chats_page(page)
+            await message.answer(text, parse_mode="HTML", reply_markup=markup)
             
-            text = f"💬 <b>Список чатов ({len(all_chats)})</b>\n\n"
-            
-            # Показываем первые 10 чатов
-            for i, chat in enumerate(all_chats[:10], 1):
-                date = datetime.fromisoformat(chat['added_date']).strftime("%d.%m.%Y")
-                last_activity = datetime.fromisoformat(chat['last_activity_date']).strftime("%d.%m %H:%M") if chat['last_activity_date'] else "Неизвестно"
-                
-                text += f"{i}. <b>{chat['title']}</b>\n"
-                text += f"   💎 Ценность: {chat['value']:.2f}\n"
-                text += f"   👥 Участников: {chat['member_count']}\n"
-                text += f"   📅 Добавлен: {date}\n"
-                text += f"   🕐 Активность: {last_activity}\n\n"
+        except Exception as e:
+            logger.error(f"Ошибка получения списка чатов: {e}")
+            await message.answer("❌ Ошибка получения списка чатов.")
+    
+    async def chats_page_callback(self, callback: CallbackQuery):
+        """Навигация по списку чатов: вперед, назад и обновление текущей страницы"""
+        if not self.is_admin(callback.from_user.id):
+            await callback.answer("❌ У вас нет прав для выполнения этой команды.", show_alert=True)
+            return
+        
+        try:
+            page = await self.db.get_chats_page(limit=CHATS_PAGE_SIZE, **self._parse_chats_callback(callback.data))
             
-            if len(all_chats) > 10:
-                text += f"... и еще {len(all_chats) - 10} чатов"
+            if not page['chats']:
+                # Страница опустела (чаты удалены или ценности изменились) - возвращаемся к началу
+                page = await self.db.get_chats_page(limit=CHATS_PAGE_SIZE)
             
-            await message.answer(text, parse_mode="HTML", reply_markup=builder.as_markup())
+            if not page['chats']:
+                await callback.message.edit_text("📭 Чатов пока нет.")
+                await callback.answer()
+                return
             
+            text, markup = self._render_chats_page(page)
+            try:
+                await callback.message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+            except TelegramBadRequest as e:
+                # При обновлении без изменений Telegram отклоняет редактирование
+                if "message is not modified" not in str(e):
+                    raise
+            await callback.answer()
+        
         except Exception as e:
-            logger.error(f"Ошибка получения списка чатов: {e}")
-            await message.answer("❌ Ошибка получения списка чатов.")
+            logger.error(f"Ошибка навигации по списку чатов: {e}")
+            await callback.answer("❌ Ошибка получения списка чатов.")
     
     async def rewards_command(self, message: Message):
         """Команда /rewards - список вознаграждений"""
@@ -108,32 +163,30 @@ class AdminCommands:
             return
         
         try:
-            all_rewards = await self.db.get_user_rewards()
+            # Агрегаты - из материализованной сводки, список - индексный запрос с LIMIT
+            summary = await self.db.get_reward_summary()
             
-            if not all_rewards:
+            if not summary['reward_count']:
                 await message.answer("💰 Вознаграждений пока нет.")
                 return
             
-            # Подсчитываем статистику
-            total_amount = sum(reward['reward_amount'] for reward in all_rewards)
-            unique_users = len(set(reward['user_id'] for reward in all_rewards))
-            unique_chats = len(set(reward['chat_id'] for reward in all_rewards))
+            latest_rewards = await self.db.get_latest_rewards(10)
             
             text = f"💰 <b>Статистика вознаграждений</b>\n\n"
-            text += f"💵 Общая сумма: <b>{total_amount:.2f}</b>\n"
-            text += f"👥 Уникальных пользователей: <b>{unique_users}</b>\n"
-            text += f"💬 Уникальных чатов: <b>{unique_chats}</b>\n"
-            text += f"📊 Всего выдач: <b>{len(all_rewards)}</b>\n\n"
+            text += f"💵 Общая сумма: <b>{summary['total_amount']:.2f}</b>\n"
+            text += f"👥 Уникальных пользователей: <b>{summary['unique_users']}</b>\n"
+            text += f"💬 Уникальных чатов: <b>{summary['unique_chats']}</b>\n"
+            text += f"📊 Всего выдач: <b>{summary['reward_count']}</b>\n\n"
             
             text += "🏆 <b>Последние 10 вознаграждений:</b>\n"
-            for reward in all_rewards[:10]:
+            for reward in latest_rewards:
                 date = datetime.fromisoformat(reward['reward_date']).strftime("%d.%m %H:%M")
                 text += f"• <b>{reward['reward_amount']:.2f}</b> - {reward['chat_title']}\n"
                 text += f"  👤 Пользователь: {reward['user_id']}\n"
                 text += f"  📅 {date}\n\n"
             
-            if len(all_rewards) > 10:
-                text += f"... и еще {len(all_rewards) - 10} вознаграждений"
+            if summary['reward_count'] > len(latest_rewards):
+                text += f"... и еще {summary['reward_count'] - len(latest_rewards)} вознаграждений"
             
             await message.answer(text, parse_mode="HTML")
             
@@ -151,7 +204,7 @@ class AdminCommands:
             # Извлекаем chat_id из команды
             command_parts = message.text.split()
             if len(command_parts) < 2:
-                await message.answer("❌ Использование: /analyze_chat <chat_id>")
+                await message.answer("❌ Использование: /analyze_chat <chat_id> [окно: 7d, 30d, 4w]")
                 return
             
             try:
@@ -160,6 +213,16 @@ class AdminCommands:
                 await message.answer("❌ Неверный формат chat_id. Используйте числовой ID.")
                 return
             
+            if len(command_parts) > 2:
+                days = self._parse_window(command_parts[2])
+                if days is None:
+                    await message.answer(
+                        f"❌ Неверное окно. Используйте, например, 7d, 30d или 4w (не более {ANALYZE_MAX_WINDOW_DAYS} дней)."
+                    )
+                    return
+                await self._analyze_chat_period(message, chat_id, days)
+                return
+            
             # Получаем статистику чата
             stats = await self.db.get_chat_stats(chat_id)
             
@@ -172,8 +235,7 @@ class AdminCommands:
             health_analysis = self.analyzer.analyze_chat_health(stats)
             
             # Получаем информацию о чате
-            all_chats = await self.db.get_all_chats()
-            chat_info = next((chat for chat in all_chats if chat['chat_id'] == chat_id), None)
+            chat_info = await self.db.get_chat(chat_id)
             
             text = f"🔍 <b>Анализ чата {chat_id}</b>\n\n"
             
@@ -204,6 +266,62 @@ class AdminCommands:
             logger.error(f"Ошибка анализа чата: {e}")
             await message.answer("❌ Ошибка анализа чата.")
     
+    def _parse_window(self, value: str) -> Optional[int]:
+        """Окно анализа в сутках из строки вида 7d или 4w (None - неверный формат)"""
+        value = value.strip().lower()
+        if len(value) < 2 or value[-1] not in ('d', 'w') or not value[:-1].isdigit():
+            return None
+        days = int(value[:-1]) * (7 if value[-1] == 'w' else 1)
+        if not 1 <= days <= ANALYZE_MAX_WINDOW_DAYS:
+            return None
+        return days
+    
+    async def _analyze_chat_period(self, message: Message, chat_id: int, days: int):
+        """Анализ чата за days суток по суточным и недельным сводкам"""
+        stats = await self.db.get_chat_period_stats(chat_id, days)
+        
+        if stats['total_messages'] == 0:
+            await message.answer(f"❌ Чат {chat_id} не найден или неактивен за {days} дн.")
+            return
+        
+        # Оценки рассчитаны на суточные показатели - передаем средний день окна
+        daily_stats = {
+            'active_users': stats['avg_daily_users'],
+            'total_messages': stats['avg_daily_messages'],
+            'member_count': stats['member_count']
+        }
+        chat_value = self.analyzer.calculate_chat_value(daily_stats)
+        health_analysis = self.analyzer.analyze_chat_health(daily_stats)
+        
+        chat_info = await self.db.get_chat(chat_id)
+        
+        text = f"🔍 <b>Анализ чата {chat_id} за {days} дн.</b>\n\n"
+        
+        if chat_info:
+            text += f"📝 Название: <b>{chat_info['title']}</b>\n"
+            text += f"👥 Участников: <b>{chat_info['member_count']}</b>\n\n"
+        
+        text += f"📊 <b>Статистика:</b>\n"
+        text += f"💬 Сообщений: <b>{stats['total_messages']}</b> (в среднем {stats['avg_daily_messages']:.1f} в день)\n"
+        text += f"📅 Активных дней: <b>{stats['active_days']}</b> из {days}\n"
+        text += f"👥 Активных пользователей в день: <b>{stats['avg_daily_users']:.1f}</b> в среднем, "
+        text += f"<b>{stats['max_daily_users']}</b> максимум\n"
+        text += f"📈 Вовлеченность: <b>{health_analysis['engagement_ratio']}</b>\n\n"
+        
+        if stats['weeks']:
+            text += f"🗓 <b>По неделям</b> (сообщений / уникальных пользователей):\n"
+            for week in stats['weeks']:
+                text += f"• с {week['start'].strftime('%d.%m.%Y')}: {week['messages']} / {week['users']}\n"
+            text += "\n"
+        
+        text += f"💎 <b>Оценка по среднему дню:</b>\n"
+        text += f"Ценность чата: <b>{chat_value:.2f}</b>\n"
+        text += f"Уровень вовлеченности: <b>{health_analysis['engagement_level']}</b>\n"
+        text += f"Состояние здоровья: <b>{health_analysis['health_status']}</b>\n"
+        text += f"Оценка здоровья: <b>{health_analysis['health_score']}/100</b>\n"
+        
+        await message.answer(text, parse_mode="HTML")
+    
     async def user_rewards_command(self, message: Message):
         """Команда /user_rewards - вознаграждения конкретного пользователя"""
         if not self.is_admin(message.from_user.id):
@@ -223,28 +341,25 @@ class AdminCommands:
                 await message.answer("❌ Неверный формат user_id. Используйте числовой ID.")
                 return
             
-            # Получаем вознаграждения пользователя
-            user_rewards = await self.db.get_user_rewards(user_id)
+            # Получаем сводку вознаграждений пользователя
+            summary = await self.db.get_user_reward_summary(user_id, limit=15)
             
-            if not user_rewards:
+            if not summary['count']:
                 await message.answer(f"❌ У пользователя {user_id} нет вознаграждений.")
                 return
             
-            # Подсчитываем общую сумму
-            total_amount = sum(reward['reward_amount'] for reward in user_rewards)
-            
             text = f"💰 <b>Вознаграждения пользователя {user_id}</b>\n\n"
-            text += f"💵 Общая сумма: <b>{total_amount:.2f}</b>\n"
-            text += f"📊 Количество выдач: <b>{len(user_rewards)}</b>\n\n"
+            text += f"💵 Общая сумма: <b>{summary['total']:.2f}</b>\n"
+            text += f"📊 Количество выдач: <b>{summary['count']}</b>\n\n"
             
             text += "📋 <b>История вознаграждений:</b>\n"
-            for reward in user_rewards[:15]:  # Показываем последние 15
+            for reward in summary['latest']:  # Показываем последние 15
                 date = datetime.fromisoformat(reward['reward_date']).strftime("%d.%m.%Y %H:%M")
                 text += f"• <b>{reward['reward_amount']:.2f}</b> - {reward['chat_title']}\n"
                 text += f"  📅 {date}\n\n"
             
-            if len(user_rewards) > 15:
-                text += f"... и еще {len(user_rewards) - 15} вознаграждений"
+            if summary['count'] > len(summary['latest']):
+                text += f"... и еще {summary['count'] - len(summary['latest'])} вознаграждений"
             
             await message.answer(text, parse_mode="HTML")
             
@@ -252,6 +367,54 @@ class AdminCommands:
             logger.error(f"Ошибка получения вознаграждений пользователя: {e}")
             await message.answer("❌ Ошибка получения вознаграждений пользователя.")
     
+    async def cache_stats_command(self, message: Message):
+        """Команда /cache_stats - счетчики кэша статистики"""
+        if not self.is_admin(message.from_user.id):
+            await message.answer("❌ У вас нет прав для выполнения этой команды.")
+            return
+        
+        command_parts = message.text.split()
+        if len(command_parts) > 1 and command_parts[1] == "clear":
+            self.db.cache.clear()
+            await message.answer("🧹 Кэш статистики очищен.")
+            return
+        
+        metrics = self.db.cache.get_metrics()
+        text = "🗄 <b>Кэш статистики</b>\n\n"
+        if not metrics['enabled']:
+            text += "⏸ Кэш отключен (многопроцессный режим), статистика читается из базы\n"
+        text += f"📦 Записей: {metrics['size']} из {metrics['max_size']}\n"
+        text += f"✅ Попаданий: {metrics['hits']}\n"
+        text += f"❌ Промахов: {metrics['misses']}\n"
+        text += f"🎯 Доля попаданий: {metrics['hit_rate']:.1%}\n"
+        text += f"♻️ Вытеснено: {metrics['evictions']}\n"
+        text += f"🔄 Инвалидаций: {metrics['invalidations']}"
+        
+        await message.answer(text, parse_mode="HTML")
+    
+    async def buffer_stats_command(self, message: Message):
+        """Команда /buffer_stats - состояние буфера записи активности"""
+        if not self.is_admin(message.from_user.id):
+            await message.answer("❌ У вас нет прав для выполнения этой команды.")
+            return
+        
+        if self.activity_buffer is None:
+            await message.answer("❌ Буфер активности не подключен.")
+            return
+        
+        metrics = self.activity_buffer.get_metrics()
+        text = "📥 <b>Буфер записи активности</b>\n\n"
+        text += f"📦 Ожидают записи: {metrics['buffer_depth']}\n"
+        text += f"💾 Сбросов: {metrics['flush_count']} ({metrics['flushed_rows']} записей)\n"
+        text += f"⏱ Длительность сброса: последняя {metrics['last_flush_ms']:.1f} мс, "
+        text += f"средняя {metrics['avg_flush_ms']:.1f} мс, макс. {metrics['max_flush_ms']:.1f} мс\n"
+        text += f"⚠️ Неудачных сбросов: {metrics['failed_flushes']}\n"
+        if metrics['retry_rows']:
+            text += f"🔁 Ожидают повтора: {metrics['retry_rows']} записей (попыток: {metrics['retry_attempts']})\n"
+        text += f"🗑 Отброшено пакетов: {metrics['dropped_batches']} ({metrics['dropped_rows']} записей)"
+        
+        await message.answer(text, parse_mode="HTML")
+    
     async def help_admin_command(self, message: Message):
         """Команда /admin_help - справка по админ-командам"""
         if not self.is_admin(message.from_user.id):
@@ -263,9 +426,11 @@ class AdminCommands:
             "<b>Статистика и мониторинг:</b>\n"
             "/stats - Общая статистика бота\n"
             "/chats - Список всех чатов\n"
-            "/rewards - Статистика вознаграждений\n\n"
+            "/rewards - Статистика вознаграждений\n"
+            "/cache_stats [clear] - Счетчики кэша статистики\n"
+            "/buffer_stats - Буфер записи активности\n\n"
             "<b>Анализ:</b>\n"
-            "/analyze_chat <chat_id> - Детальный анализ чата\n"
+            "/analyze_chat <chat_id> [7d|30d] - Детальный анализ чата (за сутки или окно из сводок)\n"
             "/user_rewards <user_id> - Вознаграждения пользователя\n\n"
             "<b>Справка:</b>\n"
             "/admin_help - Эта справка\n\n"
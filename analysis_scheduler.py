@@ -0,0 +1,120 @@
+"""
+Планировщик анализа чатов с объединением повторных запросов
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Set
+
+from config import ANALYSIS_MIN_INTERVAL, ANALYSIS_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+class AnalysisScheduler:
+    """Запускает анализ «грязных» чатов в фоне: не чаще раза за интервал на чат и с ограничением параллельности"""
+    
+    def __init__(self, analyze: Callable[[int], Awaitable], min_interval: float = ANALYSIS_MIN_INTERVAL,
+                 max_concurrency: int = ANALYSIS_MAX_CONCURRENCY):
+        self.analyze = analyze
+        self.min_interval = min_interval
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        
+        # chat_id -> время окончания последнего анализа; порядок ключей - по этому времени
+        self._last_run: Dict[int, float] = {}
+        self._pending: Set[int] = set()
+        self._running: Set[int] = set()
+        # Чаты, помеченные во время выполнения анализа - будут проанализированы повторно
+        self._rerun: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        
+        # Метрики
+        self.runs = 0
+        self.failures = 0
+        self.coalesced = 0
+    
+    @property
+    def pending_count(self) -> int:
+        """Количество чатов, ожидающих анализа"""
+        return len(self._pending)
+    
+    @property
+    def running_count(self) -> int:
+        """Количество выполняющихся анализов"""
+        return len(self._running)
+    
+    def _evict_expired(self, now: float):
+        """Удаление отметок старше интервала - они уже не задерживают анализ"""
+        while self._last_run:
+            chat_id = next(iter(self._last_run))
+            if self._last_run[chat_id] + self.min_interval > now:
+                break
+            del self._last_run[chat_id]
+    
+    def mark_dirty(self, chat_id: int):
+        """Отметка чата как изменившегося (без ожидания анализа)"""
+        self._evict_expired(time.monotonic())
+        
+        if chat_id in self._pending:
+            self.coalesced += 1
+            return
+        
+        if chat_id in self._running:
+            self.coalesced += 1
+            self._rerun.add(chat_id)
+            return
+        
+        self._pending.add(chat_id)
+        task = asyncio.create_task(self._run_chat(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run_chat(self, chat_id: int):
+        """Ожидание окончания интервала и анализ чата"""
+        try:
+            last_run = self._last_run.get(chat_id)
+            if last_run is not None:
+                delay = last_run + self.min_interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            
+            async with self._semaphore:
+                self._pending.discard(chat_id)
+                self._running.add(chat_id)
+                try:
+                    await self.analyze(chat_id)
+                    self.runs += 1
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"Ошибка фонового анализа чата {chat_id}: {e}")
+                finally:
+                    self._running.discard(chat_id)
+                    # Перевставка сохраняет упорядоченность по времени для _evict_expired
+                    self._last_run.pop(chat_id, None)
+                    self._last_run[chat_id] = time.monotonic()
+        finally:
+            self._pending.discard(chat_id)
+        
+        if chat_id in self._rerun:
+            self._rerun.discard(chat_id)
+            self.mark_dirty(chat_id)
+    
+    async def stop(self):
+        """Отмена ожидающих и выполняющихся анализов"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+        self._rerun.clear()
+    
+    def get_metrics(self) -> Dict:
+        """Метрики планировщика"""
+        return {
+            'pending': self.pending_count,
+            'running': self.running_count,
+            'runs': self.runs,
+            'failures': self.failures,
+            'coalesced': self.coalesced,
+            'tracked_chats': len(self._last_run)
+        }
@@ -0,0 +1,305 @@
+"""
+Общий планировщик исходящих запросов к Bot API с ограничением частоты
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    ADMIN_ID, API_GLOBAL_RATE, API_CHAT_RATE, API_GROUP_RATE, API_CHAT_BURST, API_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: меньшее значение обслуживается раньше
+PRIORITY_ADMIN = 0
+PRIORITY_NORMAL = 1
+PRIORITY_NOTIFICATION = 2
+PRIORITY_NAMES = {PRIORITY_ADMIN: 'admin', PRIORITY_NORMAL: 'normal', PRIORITY_NOTIFICATION: 'notification'}
+
+# Методы, не проходящие через очередь (длинный опрос не должен ждать рассылок)
+UNTHROTTLED_METHODS = {'getUpdates', 'getMe', 'deleteWebhook', 'setWebhook', 'close', 'logOut'}
+
+# Приоритет запросов текущей задачи
+current_priority: ContextVar[int] = ContextVar('current_priority', default=PRIORITY_NORMAL)
+
+# Сколько запросов каждой очереди просматривается в поисках чата с доступным токеном
+_SCAN_LIMIT = 256
+
+@contextmanager
+def request_priority(priority: int):
+    """Выполнение запросов к Bot API внутри блока с указанным приоритетом"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не более capacity подряд"""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+    
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = now
+        self.paused_until = 0.0
+    
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def ready_at(self, now: float) -> float:
+        """Момент, когда будет доступен токен"""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.paused_until)
+    
+    def take(self, now: float):
+        """Расход токена (после проверки ready_at)"""
+        self._refill(now)
+        self.tokens -= 1
+    
+    def pause(self, until: float):
+        """Запрет выдачи токенов до момента until (ответ 429 с retry_after)"""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = min(self.tokens, 0.0)
+    
+    def is_idle(self, now: float) -> bool:
+        """Ведро полное и не приостановлено - его можно удалить без потери ограничения"""
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+class ApiScheduler:
+    """
+    Выдает разрешения на запросы к Bot API
+    
+    Запрос ждет токена в глобальном ведре (API_GLOBAL_RATE в секунду) и в ведре своего
+    чата (API_CHAT_RATE для личных чатов, API_GROUP_RATE для групп). Среди ожидающих
+    первыми обслуживаются запросы с более высоким приоритетом; запрос в «занятый» чат
+    не задерживает запросы в другие чаты.
+    """
+    
+    def __init__(self, global_rate: float = API_GLOBAL_RATE, chat_rate: float = API_CHAT_RATE,
+                 group_rate: float = API_GROUP_RATE, chat_burst: float = API_CHAT_BURST):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        # Глобальный лимит соблюдается равномерно: без всплеска в начале каждой секунды
+        self._global = TokenBucket(global_rate, 1.0, time.monotonic())
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._queues: List[Deque] = [deque() for _ in PRIORITY_NAMES]
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        
+        # Метрики
+        self.granted = 0
+        self.retry_after_count = 0
+        self._wait_samples: Deque[float] = deque(maxlen=1000)
+        self._send_samples: Deque[float] = deque(maxlen=1000)
+    
+    def set_global_rate(self, rate: float):
+        """Изменение общего лимита (например, при разделении его между процессами)"""
+        self._global.rate = rate
+    
+    @property
+    def queue_depth(self) -> int:
+        """Количество запросов, ожидающих разрешения"""
+        return sum(len(queue) for queue in self._queues)
+    
+    def _bucket(self, chat_id, now: float) -> TokenBucket:
+        """Ведро чата (создается при первом запросе)"""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Группы и каналы имеют отрицательный ID или @username
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+    
+    async def acquire(self, chat_id=None, priority: int = PRIORITY_NORMAL):
+        """Ожидание разрешения на запрос в чат chat_id (None - запрос без чата)"""
+        if self._task is None:
+            self.start()
+        
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        self._queues[priority].append((chat_id, future))
+        self._wakeup.set()
+        await future
+        self._wait_samples.append(time.monotonic() - enqueued)
+    
+    def pause(self, chat_id, retry_after: float):
+        """Приостановка запросов в чат (или всех запросов, если chat_id не указан)"""
+        self.retry_after_count += 1
+        now = time.monotonic()
+        bucket = self._global if chat_id is None else self._bucket(chat_id, now)
+        bucket.pause(now + retry_after)
+        self._wakeup.set()
+    
+    def record_send(self, duration: float):
+        """Учет длительности выполненного запроса"""
+        self._send_samples.append(duration)
+    
+    def _pick(self, now: float):
+        """Самый приоритетный запрос с доступным токеном чата и ближайший момент готовности остальных"""
+        earliest = None
+        for queue in self._queues:
+            for index, (chat_id, future) in enumerate(queue):
+                if index >= _SCAN_LIMIT:
+                    break
+                if future.done():
+                    # Ожидающий запрос отменен - убираем его при следующем проходе
+                    continue
+                ready = now if chat_id is None else self._bucket(chat_id, now).ready_at(now)
+                if ready <= now:
+                    del queue[index]
+                    return chat_id, future, None
+                earliest = ready if earliest is None else min(earliest, ready)
+        return None, None, earliest
+    
+    def _drop_cancelled(self):
+        """Удаление отмененных запросов из очередей"""
+        for priority, queue in enumerate(self._queues):
+            if any(future.done() for _, future in queue):
+                self._queues[priority] = deque(item for item in queue if not item[1].done())
+    
+    def _prune_buckets(self, now: float):
+        """Удаление простаивающих ведер чатов"""
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+    
+    async def _dispatch(self):
+        """Цикл выдачи разрешений"""
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            
+            global_ready = self._global.ready_at(now)
+            if global_ready > now:
+                await asyncio.sleep(global_ready - now)
+                continue
+            
+            self._drop_cancelled()
+            chat_id, future, earliest = self._pick(now)
+            if future is None:
+                timeout = None if earliest is None else earliest - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            self._global.take(now)
+            if chat_id is not None:
+                self._bucket(chat_id, now).take(now)
+            future.set_result(None)
+            self.granted += 1
+            
+            if self.granted % 1000 == 0:
+                self._prune_buckets(now)
+    
+    def start(self):
+        """Запуск цикла выдачи разрешений"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch())
+    
+    async def stop(self):
+        """Остановка: ожидающие запросы пропускаются без ограничения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        for queue in self._queues:
+            while queue:
+                _, future = queue.popleft()
+                if not future.done():
+                    future.set_result(None)
+    
+    @staticmethod
+    def _summary_ms(samples) -> Dict:
+        """Среднее и p95 выборки в миллисекундах"""
+        if not samples:
+            return {'avg_ms': 0.0, 'p95_ms': 0.0}
+        ordered = sorted(samples)
+        return {
+            'avg_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2)
+        }
+    
+    def get_metrics(self) -> Dict:
+        """Глубина очередей, задержки ожидания и выполнения запросов"""
+        return {
+            'queue_depth': self.queue_depth,
+            'queue_depth_by_priority': {
+                PRIORITY_NAMES[priority]: len(queue) for priority, queue in enumerate(self._queues)
+            },
+            'granted': self.granted,
+            'retry_after': self.retry_after_count,
+            'chat_buckets': len(self._chat_buckets),
+            'wait': self._summary_ms(self._wait_samples),
+            'send': self._summary_ms(self._send_samples)
+        }
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Промежуточный слой сессии бота: все вызовы Bot API (message.answer, bot.send_message,
+    get_chat_administrators и т.д.) проходят через ApiScheduler. Ответ 429 приостанавливает
+    чат на retry_after секунд, после чего запрос повторяется до max_retries раз.
+    """
+    
+    def __init__(self, scheduler: ApiScheduler, max_retries: int = API_MAX_RETRIES):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+    
+    async def __call__(self, make_request, bot, method):
+        if method.__api_method__ in UNTHROTTLED_METHODS:
+            return await make_request(bot, method)
+        
+        chat_id = getattr(method, 'chat_id', None)
+        priority = current_priority.get()
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(chat_id, priority)
+            start = time.monotonic()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.scheduler.pause(chat_id, e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning("Ограничение частоты для %s в чате %s: повтор через %s с",
+                               method.__api_method__, chat_id, e.retry_after)
+            finally:
+                self.scheduler.record_send(time.monotonic() - start)
+
+class AdminPriorityMiddleware(BaseMiddleware):
+    """Ответы на события от администратора отправляются с приоритетом PRIORITY_ADMIN"""
+    
+    def __init__(self, admin_id: Optional[int] = ADMIN_ID):
+        self.admin_id = admin_id
+    
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+                       event: Any, data: Dict[str, Any]) -> Any:
+        user = getattr(event, 'from_user', None)
+        if self.admin_id and user is not None and user.id == self.admin_id:
+            with request_priority(PRIORITY_ADMIN):
+                return await handler(event, data)
+        return await handler(event, data)
@@ -0,0 +1,283 @@
+"""
+Онлайн-резервное копирование базы данных через SQLite backup API
+"""
+
+import asyncio
+import errno
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+from config import (
+    DATABASE_PATH, BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, BACKUP_COMPRESS,
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP
+)
+
+logger = logging.getLogger(__name__)
+
+# Префикс имен файлов резервных копий (по нему же выбираются копии для удаления)
+BACKUP_PREFIX = 'backup_'
+
+# Размер блока при сжатии копии, байт
+_COMPRESS_CHUNK = 1024 * 1024
+
+# Степень сжатия gzip (9 заметно медленнее при почти том же размере)
+_COMPRESS_LEVEL = 6
+
+# Интервал замеров задержки цикла событий и ожидания записи во время копирования, секунд
+_PROBE_INTERVAL = 0.05
+
+class _Aborted(Exception):
+    """Копирование или сжатие прервано отменой резервного копирования"""
+
+async def _run_in_thread(abort: threading.Event, func, *args):
+    """
+    Выполнение func в отдельном потоке с прерыванием при отмене задачи
+    
+    Отмена задачи не останавливает поток: он получает сигнал через abort, и задача
+    дожидается его завершения, чтобы временные файлы удалялись уже после последней записи.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        abort.set()
+        await asyncio.gather(future, return_exceptions=True)
+        raise
+
+def _copy_pages(db_path: str, dest_path: str, pages: int, step_sleep: float, abort: threading.Event) -> Dict:
+    """
+    Постраничное копирование базы (выполняется в отдельном потоке)
+    
+    Исходное соединение держит открытую транзакцию чтения: в режиме WAL копия получается
+    согласованной на момент ее начала, запись в базу между шагами продолжается и не
+    перезапускает копирование. После каждого шага поток спит step_sleep секунд, ограничивая
+    нагрузку копирования на диск (параметр sleep у backup() действует только при SQLITE_BUSY
+    и SQLITE_LOCKED, поэтому пауза делается явно).
+    """
+    progress = {'steps': 0, 'total': 0}
+    
+    def on_progress(status, remaining, total):
+        if abort.is_set():
+            raise _Aborted()
+        progress['steps'] += 1
+        progress['total'] = total
+        if remaining and step_sleep > 0:
+            time.sleep(step_sleep)
+    
+    source = sqlite3.connect(db_path, isolation_level=None)
+    target = sqlite3.connect(dest_path)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+        source.backup(target, pages=pages, progress=on_progress, sleep=step_sleep)
+        source.execute("ROLLBACK")
+    finally:
+        target.close()
+        source.close()
+    return {'pages': progress['total'], 'steps': progress['steps'], 'page_size': page_size}
+
+def _compress_file(source_path: str, dest_path: str, abort: threading.Event):
+    """Сжатие файла gzip блоками, без чтения целиком в память"""
+    with open(source_path, 'rb') as source, gzip.open(dest_path, 'wb', compresslevel=_COMPRESS_LEVEL) as dest:
+        while True:
+            if abort.is_set():
+                raise _Aborted()
+            chunk = source.read(_COMPRESS_CHUNK)
+            if not chunk:
+                break
+            dest.write(chunk)
+
+def default_backup_path(directory: str = BACKUP_DIR, compress: bool = BACKUP_COMPRESS) -> str:
+    """Имя файла резервной копии с текущим временем"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(directory, f"{BACKUP_PREFIX}{timestamp}.db" + (".gz" if compress else ""))
+
+async def _probe_stalls(db_path: str, done: asyncio.Event, stalls: Dict):
+    """
+    Замеры во время копирования: максимальная задержка цикла событий и максимальное
+    ожидание блокировки записи (BEGIN IMMEDIATE) - столько ждал бы бот при записи в базу
+    """
+    loop = asyncio.get_running_loop()
+    async with aiosqlite.connect(db_path, isolation_level=None) as conn:
+        while not done.is_set():
+            expected = loop.time() + _PROBE_INTERVAL
+            try:
+                await asyncio.wait_for(done.wait(), _PROBE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            stalls['loop_ms'] = max(stalls['loop_ms'], (loop.time() - expected) * 1000)
+            
+            start = time.perf_counter()
+            await conn.execute("BEGIN IMMEDIATE")
+            await conn.execute("ROLLBACK")
+            stalls['write_ms'] = max(stalls['write_ms'], (time.perf_counter() - start) * 1000)
+
+async def online_backup(db_path: str = DATABASE_PATH, dest_path: str = None,
+                        compress: bool = BACKUP_COMPRESS, pages: int = BACKUP_PAGES_PER_STEP,
+                        step_sleep: float = BACKUP_STEP_SLEEP, probe: bool = False) -> Dict:
+    """
+    Резервная копия работающей базы
+    
+    Копирование идет шагами по pages страниц в отдельном потоке, поэтому цикл событий не
+    блокируется, а запись в базу не ждет окончания копирования. Копия пишется во временный
+    файл и переименовывается только после успешного завершения. Backup API пишет только
+    в файл базы, поэтому при compress сначала создается несжатая копия и сжимается уже она:
+    на диске нужно место на размер базы плюс сжатый файл (проверяется до начала). При отмене
+    задачи копирование прерывается, временные файлы удаляются после остановки потока.
+    
+    Args:
+        probe: замерять задержку цикла событий и ожидание записи (_probe_stalls). Замер сам
+            берет блокировку записи каждые _PROBE_INTERVAL секунд, поэтому только для ручного запуска
+    
+    Returns:
+        путь к копии, число страниц, скорость и замеренные задержки (None без probe)
+    """
+    dest_path = dest_path or default_backup_path(compress=compress)
+    directory = os.path.dirname(dest_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    # Сжатая копия не больше исходной, поэтому с compress достаточно двойного размера базы
+    needed = os.path.getsize(db_path) * (2 if compress else 1)
+    free = shutil.disk_usage(directory or '.').free
+    if free < needed:
+        raise OSError(errno.ENOSPC, f"Недостаточно места для резервной копии: нужно {needed} байт, свободно {free}")
+    
+    pages_path = (dest_path[:-len('.gz')] if dest_path.endswith('.gz') else dest_path) + '.part'
+    abort = threading.Event()
+    stalls = {'loop_ms': 0.0, 'write_ms': 0.0}
+    done = asyncio.Event()
+    probe_task = asyncio.create_task(_probe_stalls(db_path, done, stalls)) if probe else None
+    start = time.perf_counter()
+    try:
+        result = await _run_in_thread(abort, _copy_pages, db_path, pages_path, pages, step_sleep, abort)
+        copy_duration = time.perf_counter() - start
+        done.set()
+        if probe_task is not None:
+            await probe_task
+        
+        if compress:
+            compressed_path = dest_path + '.part'
+            await _run_in_thread(abort, _compress_file, pages_path, compressed_path, abort)
+            os.remove(pages_path)
+            os.replace(compressed_path, dest_path)
+        else:
+            os.replace(pages_path, dest_path)
+    finally:
+        if probe_task is not None and not probe_task.done():
+            probe_task.cancel()
+        for path in (pages_path, dest_path + '.part'):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    duration = time.perf_counter() - start
+    result.update({
+        'path': dest_path,
+        'size': os.path.getsize(dest_path),
+        'compressed': compress,
+        'duration': round(duration, 3),
+        'pages_per_sec': round(result['pages'] / copy_duration, 1) if copy_duration > 0 else 0.0,
+        'loop_stall_ms': round(stalls['loop_ms'], 2) if probe else None,
+        'write_stall_ms': round(stalls['write_ms'], 2) if probe else None
+    })
+    return result
+
+def list_backups(directory: str = BACKUP_DIR) -> List[str]:
+    """Пути к резервным копиям каталога от старых к новым"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(BACKUP_PREFIX) and (name.endswith('.db') or name.endswith('.db.gz'))
+    )
+    return [os.path.join(directory, name) for name in names]
+
+def prune_backups(directory: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> List[str]:
+    """Удаление старых копий сверх keep последних; возвращает удаленные пути"""
+    backups = list_backups(directory)
+    removed = backups[:max(0, len(backups) - keep)]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+class BackupJob:
+    """Резервное копирование по расписанию с хранением BACKUP_KEEP последних копий"""
+    
+    def __init__(self, db_path: str = DATABASE_PATH, directory: str = BACKUP_DIR,
+                 interval: float = BACKUP_INTERVAL, keep: int = BACKUP_KEEP, compress: bool = BACKUP_COMPRESS):
+        self.db_path = db_path
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.compress = compress
+        self._task: Optional[asyncio.Task] = None
+        
+        # Метрики
+        self.runs = 0
+        self.failures = 0
+        self.last_backup: Optional[Dict] = None
+    
+    async def run_once(self) -> Dict:
+        """Создание копии и удаление устаревших"""
+        result = await online_backup(
+            self.db_path, default_backup_path(self.directory, self.compress), compress=self.compress
+        )
+        removed = prune_backups(self.directory, self.keep)
+        
+        self.runs += 1
+        self.last_backup = result
+        logger.info(f"Резервная копия {result['path']}: {result['pages']} страниц за {result['duration']:.1f} с "
+                    f"({result['pages_per_sec']:.0f} стр/с), удалено старых копий: {len(removed)}")
+        return result
+    
+    def _first_delay(self) -> float:
+        """Задержка до первой копии: отсчет от последней существующей, чтобы перезапуски не сбивали расписание"""
+        backups = list_backups(self.directory)
+        if not backups:
+            return 0.0
+        age = time.time() - os.path.getmtime(backups[-1])
+        return max(0.0, self.interval - age)
+    
+    async def _run(self):
+        """Фоновый цикл резервного копирования"""
+        await asyncio.sleep(self._first_delay())
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Ошибка резервного копирования: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        """Запуск резервного копирования по расписанию"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановка резервного копирования (прерванная копия не сохраняется, поток копирования дожидается)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def get_metrics(self) -> Dict:
+        """Метрики резервного копирования"""
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_backup': self.last_backup
+        }
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Скрипт для замера производительности компонентов бота
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import argparse
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+# Добавляем текущую директорию в путь для импорта модулей
+sys.path.insert(0, str(Path(__file__).parent))
+
+import aiosqlite
+from aiogram.exceptions import TelegramRetryAfter
+
+from database import Database
+from chat_analyzer import ChatAnalyzer
+
+def print_latency(title: str, samples: list):
+    """Вывод сводки по задержкам (в миллисекундах)"""
+    samples = sorted(samples)
+    count = len(samples)
+    avg = sum(samples) / count
+    p50 = samples[count // 2]
+    p99 = samples[min(count - 1, int(count * 0.99))]
+    print(f"   {title:<28} среднее {avg:.3f} мс | p50 {p50:.3f} мс | p99 {p99:.3f} мс")
+
+async def bench_db_calls(iterations: int = 1000):
+    """Задержка вызова: соединение на каждый вызов против пула соединений"""
+    print(f"🗄️  Задержка вызовов БД ({iterations} итераций)...")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "bench.db")
+        db = Database(db_path)
+        await db.init_db()
+        await db.add_chat(-100, "Бенчмарк", 1)
+        
+        # До: новое соединение (и новый поток) на каждый вызов
+        before_write, before_read = [], []
+        for i in range(iterations):
+            start = time.perf_counter()
+            async with aiosqlite.connect(db_path) as conn:
+                await conn.execute(
+                    "INSERT OR IGNORE INTO users (user_id, username, registration_date) VALUES (?, ?, datetime('now'))",
+                    (i, f"user_{i}")
+                )
+                await conn.commit()
+            before_write.append((time.perf_counter() - start) * 1000)
+            
+            start = time.perf_counter()
+            async with aiosqlite.connect(db_path) as conn:
+                cursor = await conn.execute("SELECT member_count, value FROM chats WHERE chat_id = ?", (-100,))
+                await cursor.fetchone()
+            before_read.append((time.perf_counter() - start) * 1000)
+        
+        # После: постоянные соединения из пула
+        after_write, after_read = [], []
+        for i in range(iterations):
+            start = time.perf_counter()
+            await db.add_user(iterations + i, f"user_{iterations + i}")
+            after_write.append((time.perf_counter() - start) * 1000)
+            
+            start = time.perf_counter()
+            await db.get_chat_stats(-100)
+            after_read.append((time.perf_counter() - start) * 1000)
+        
+        await db.close()
+    
+    print("📉 До (aiosqlite.connect на каждый вызов):")
+    print_latency("запись (add_user)", before_write)
+    print_latency("чтение (одна выборка)", before_read)
+    print("📈 После (пул соединений):")
+    print_latency("запись (add_user)", after_write)
+    print_latency("чтение (get_chat_stats)", after_read)
+
+def bench_analyzer(chats: int = 10000):
+    """Скалярный анализ в цикле против пакетного (NumPy)"""
+    import numpy as np
+    
+    print(f"🧮 Анализ {chats} чатов: скалярный против пакетного...")
+    
+    rng = random.Random(42)
+    active_users = [rng.randint(0, 300) for _ in range(chats)]
+    total_messages = [rng.choice([0, rng.randint(1, 5000)]) for _ in range(chats)]
+    member_count = [rng.randint(0, 10000) for _ in range(chats)]
+    
+    analyzer = ChatAnalyzer()
+    # Замеряем вычисления, а не вывод журнала
+    logging.disable(logging.CRITICAL)
+    try:
+        start = time.perf_counter()
+        scalar_values, scalar_levels, scalar_scores = [], [], []
+        for a, t, m in zip(active_users, total_messages, member_count):
+            stats = {'active_users': a, 'total_messages': t, 'member_count': m}
+            scalar_values.append(analyzer.calculate_chat_value(stats))
+            health = analyzer.analyze_chat_health(stats)
+            scalar_levels.append(health['engagement_level'])
+            scalar_scores.append(health['health_score'])
+        scalar_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        batch = analyzer.analyze_chats_batch(
+            np.array(active_users), np.array(total_messages), np.array(member_count)
+        )
+        batch_time = time.perf_counter() - start
+    finally:
+        logging.disable(logging.NOTSET)
+    
+    identical = (
+        scalar_values == batch['value'].tolist()
+        and scalar_levels == batch['engagement_level'].tolist()
+        and scalar_scores == batch['health_score'].tolist()
+    )
+    
+    print(f"   скалярный: {scalar_time * 1000:.1f} мс ({scalar_time / chats * 1e6:.2f} мкс/чат)")
+    print(f"   пакетный:  {batch_time * 1000:.1f} мс ({batch_time / chats * 1e6:.2f} мкс/чат)")
+    print(f"   ускорение: x{scalar_time / batch_time:.1f}")
+    print(f"   результаты совпадают: {'✅ да' if identical else '❌ нет'}")
+
+def bench_logging(iterations: int = 20000):
+    """Пропускная способность горячего пути с логированием: синхронный FileHandler против очереди"""
+    import logging_setup
+    
+    print(f"📝 Логирование на горячем пути ({iterations} итераций)...")
+    
+    analyzer = ChatAnalyzer()
+    bench_logger = logging.getLogger('bot')
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    
+    def hot_path():
+        """Анализ чата и строка журнала, как в analyze_and_reward_chat"""
+        latencies = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            stats = {'active_users': 10 + i % 50, 'total_messages': 100 + i % 500, 'member_count': 200}
+            chat_value = analyzer.calculate_chat_value(stats)
+            bench_logger.info("Анализ чата %s: ценность %s, активных %s, сообщений %s",
+                              i, chat_value, stats['active_users'], stats['total_messages'])
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+    
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull:
+        try:
+            # До: синхронная запись на диск в потоке цикла событий
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            file_handler = logging.FileHandler(Path(tmp_dir) / 'sync.log', encoding='utf-8')
+            file_handler.setFormatter(logging.Formatter(logging_setup.LOG_FORMAT))
+            root.addHandler(file_handler)
+            root.setLevel(logging.INFO)
+            sync_latencies = hot_path()
+            root.removeHandler(file_handler)
+            file_handler.close()
+            
+            # После: очередь и фоновый поток записи
+            logging_setup.setup_logging(str(Path(tmp_dir) / 'queue.log'), stream=devnull)
+            queue_latencies = hot_path()
+            logging_setup.shutdown_logging()
+        finally:
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+    
+    # Очередь выигрывает не в средней пропускной способности, а в хвосте задержек:
+    # медленный диск больше не останавливает цикл событий
+    for title, latencies in (("FileHandler", sync_latencies), ("QueueHandler", queue_latencies)):
+        print(f"   {title}: {iterations / (sum(latencies) / 1000):,.0f} итераций/с, "
+              f"макс. задержка {max(latencies):.3f} мс")
+        print_latency("задержка итерации", latencies)
+
+class FakeTelegramApi:
+    """Локальная имитация Bot API: задержка ответа и ответы 429 при превышении лимитов"""
+    
+    def __init__(self, global_rate: float, chat_rate: float, latency: float = 0.005):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.latency = latency
+        self._last_chat_send = {}
+        self._recent = deque()
+        self.sent = 0
+        self.rejected = 0
+    
+    async def make_request(self, bot, method):
+        """Совместим с make_request сессии aiogram"""
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self._recent and self._recent[0] <= now - 1:
+            self._recent.popleft()
+        
+        last = self._last_chat_send.get(method.chat_id)
+        if len(self._recent) >= self.global_rate or (last is not None and now - last < 0.9 / self.chat_rate):
+            self.rejected += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        
+        self._recent.append(now)
+        self._last_chat_send[method.chat_id] = now
+        self.sent += 1
+        return True
+
+async def bench_api(requests: int = 200, chats: int = 100, global_rate: float = 30.0, chat_rate: float = 1.0):
+    """Прямые вызовы с повтором после 429 против планировщика ApiScheduler на имитации Bot API"""
+    from aiogram.methods import SendMessage
+    from api_scheduler import (
+        ApiScheduler, RateLimitMiddleware, PRIORITY_ADMIN, PRIORITY_NOTIFICATION, request_priority
+    )
+    
+    print(f"📡 Запросы к Bot API ({requests} сообщений в {chats} чатов, "
+          f"лимиты {global_rate:g}/с на бота и {chat_rate:g}/с на чат)...")
+    methods = [SendMessage(chat_id=1 + i % chats, text="тест") for i in range(requests)]
+    
+    # До: все запросы сразу, повтор вслепую после retry_after
+    api = FakeTelegramApi(global_rate, chat_rate)
+    
+    async def direct(method):
+        while True:
+            try:
+                return await api.make_request(None, method)
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(direct(method) for method in methods))
+    direct_time = time.perf_counter() - start
+    print(f"   напрямую:    {direct_time:.2f} с, ответов 429: {api.rejected}")
+    
+    # После: те же запросы через планировщик; часть - ответы администратору
+    api = FakeTelegramApi(global_rate, chat_rate)
+    scheduler = ApiScheduler(global_rate=global_rate, chat_rate=chat_rate, group_rate=chat_rate)
+    middleware = RateLimitMiddleware(scheduler)
+    waits = {PRIORITY_ADMIN: [], PRIORITY_NOTIFICATION: []}
+    
+    async def scheduled(method, priority):
+        with request_priority(priority):
+            started = time.perf_counter()
+            await middleware(api.make_request, None, method)
+            waits[priority].append((time.perf_counter() - started) * 1000)
+    
+    admin_every = 20
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        scheduled(method, PRIORITY_ADMIN if i % admin_every == 0 else PRIORITY_NOTIFICATION)
+        for i, method in enumerate(methods)
+    ))
+    scheduled_time = time.perf_counter() - start
+    metrics = scheduler.get_metrics()
+    await scheduler.stop()
+    
+    print(f"   планировщик: {scheduled_time:.2f} с, ответов 429: {api.rejected}")
+    print_latency("ответы администратору", waits[PRIORITY_ADMIN])
+    print_latency("уведомления", waits[PRIORITY_NOTIFICATION])
+    print(f"   метрики планировщика: выдано {metrics['granted']}, "
+          f"ожидание p95 {metrics['wait']['p95_ms']} мс, запрос p95 {metrics['send']['p95_ms']} мс")
+
+async def bench_webhook(requests: int = 2000, connections: int = 40, max_in_flight: int = 200,
+                        handler_delay: float = 0.005):
+    """Пропускная способность приема синтетических обновлений локальным webhook-сервером"""
+    import aiohttp
+    from aiohttp import web
+    from aiogram import Bot, Dispatcher
+    from aiogram.types import Message
+    from webhook import create_webhook_app
+    
+    print(f"🌐 Webhook ({requests} обновлений, {connections} соединений, "
+          f"не более {max_in_flight} в обработке, обработчик {handler_delay * 1000:g} мс)...")
+    
+    dp = Dispatcher()
+    handled = 0
+    
+    @dp.message()
+    async def handle(message: Message):
+        nonlocal handled
+        await asyncio.sleep(handler_delay)
+        handled += 1
+    
+    bot = Bot(token="123456:BENCHMARK")
+    secret = "benchmark-secret"
+    app, handler = create_webhook_app(dp, bot, path="/webhook", secret_token=secret, max_in_flight=max_in_flight)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/webhook"
+    
+    def update(update_id: int) -> dict:
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": -100 - update_id % 50, "type": "group", "title": "bench"},
+                "from": {"id": 1 + update_id % 500, "is_bot": False, "first_name": "user"},
+                "text": "сообщение"
+            }
+        }
+    
+    statuses = {}
+    latencies = []
+    next_id = iter(range(requests))
+    
+    async def sender(session):
+        for update_id in next_id:
+            start = time.perf_counter()
+            async with session.post(url, json=update(update_id),
+                                    headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append((time.perf_counter() - start) * 1000)
+    
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=connections)) as session:
+            async with session.post(url, json=update(0)) as response:
+                unauthorized = response.status
+            
+            start = time.perf_counter()
+            await asyncio.gather(*(sender(session) for _ in range(connections)))
+            accept_time = time.perf_counter() - start
+            while handler.in_flight:
+                await asyncio.sleep(0.01)
+            total_time = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+    
+    print(f"   без секретного токена: HTTP {unauthorized}")
+    print(f"   ответы: {statuses}")
+    print(f"   прием: {requests / accept_time:,.0f} обновлений/с, "
+          f"обработка: {handled / total_time:,.0f} обновлений/с ({handled} обработано)")
+    print_latency("ответ webhook", latencies)
+    print(f"   метрики: {handler.get_metrics()}")
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарки Reward Bot")
+    parser.add_argument('action', choices=['db', 'analyzer', 'logging', 'api', 'webhook'], help='Бенчмарк для запуска')
+    parser.add_argument('--iterations', type=int, default=1000,
+                       help='Количество итераций (по умолчанию: 1000)')
+    parser.add_argument('--chats', type=int, default=10000,
+                       help='Количество чатов для бенчмарка анализатора (по умолчанию: 10000); '
+                            'для api - не больше --requests')
+    parser.add_argument('--requests', type=int, default=200,
+                       help='Количество сообщений для бенчмарка Bot API и обновлений для webhook (по умолчанию: 200)')
+    
+    args = parser.parse_args()
+    
+    try:
+        if args.action == 'db':
+            asyncio.run(bench_db_calls(args.iterations))
+        elif args.action == 'analyzer':
+            bench_analyzer(args.chats)
+        elif args.action == 'logging':
+            bench_logging(args.iterations)
+        elif args.action == 'api':
+            asyncio.run(bench_api(args.requests, min(args.chats, args.requests)))
+        elif args.action == 'webhook':
+            asyncio.run(bench_webhook(args.requests))
+    except KeyboardInterrupt:
+        print("\n⏹️  Бенчмарк прерван пользователем")
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,52 @@
 import asyncio
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command, ChatMemberUpdatedFilter, KICKED, LEFT, MEMBER, ADMINISTRATOR, CREATOR
-from aiogram.types import ChatMemberUpdated, Message
+from aiogram.types import CallbackQuery, ChatMemberUpdated, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from config import BOT_TOKEN, ADMIN_ID, REWARD_COEFFICIENT
+from config import BOT_TOKEN, ADMIN_ID, REWARD_COEFFICIENT, ACTIVITY_ROLLUP_INTERVAL, WEBHOOK_URL, SHARD_WORKERS
 from database import Database
 from chat_analyzer import ChatAnalyzer
 from admin_commands import AdminCommands
+from activity_buffer import ActivityBuffer
+from activity_window import ActivityWindow
+from analysis_scheduler import AnalysisScheduler
+from revaluation import RevaluationJob
+from notifications import NotificationSender
+from backup import BackupJob
+from vacuum import VacuumJob
+from api_scheduler import ApiScheduler, RateLimitMiddleware, AdminPriorityMiddleware
+from webhook import run_webhook
+from sharding import run_sharded
+
+from logging_setup import setup_logging, shutdown_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# Все исходящие запросы к Bot API проходят через общий планировщик с ограничением частоты
+api_scheduler = ApiScheduler()
+bot.session.middleware(RateLimitMiddleware(api_scheduler))
+dp.message.middleware(AdminPriorityMiddleware())
+dp.callback_query.middleware(AdminPriorityMiddleware())
+
 # Инициализация базы данных и анализатора
 db = Database()
 analyzer = ChatAnalyzer()
-admin_commands = AdminCommands(bot, db, analyzer)
+activity_buffer = ActivityBuffer(db)
+activity_window = ActivityWindow(db)
+revaluation_job = RevaluationJob(db, analyzer, activity_window=activity_window)
+notification_sender = NotificationSender(db, bot)
+backup_job = BackupJob(db.db_path)
+vacuum_job = VacuumJob(db)
+admin_commands = AdminCommands(bot, db, analyzer, activity_buffer)
 
 @dp.message(Command("start"))
 async def start_command(message: Message):
@@ -91,25 +106,23 @@ async def my_rewards_command(message: Message):
     """Показать вознаграждения пользователя"""
     try:
         user_id = message.from_user.id
-        rewards = await db.get_user_rewards(user_id)
+        # Сводка: сумма и количество из users, последние 10 - по индексу (user_id, reward_date)
+        summary = await db.get_user_reward_summary(user_id, limit=10)
         
-        if not rewards:
+        if not summary['count']:
             await message.answer("У вас пока нет вознаграждений. Добавьте бота в активный чат!")
             return
         
-        # Подсчитываем общую сумму
-        total_amount = sum(reward['reward_amount'] for reward in rewards)
-        
         text = f"💰 <b>Ваши вознаграждения</b>\n\n"
-        text += f"Общая сумма: <b>{total_amount:.2f}</b>\n\n"
+        text += f"Общая сумма: <b>{summary['total']:.2f}</b>\n\n"
         
-        for reward in rewards[:10]:  # Показываем последние 10
+        for reward in summary['latest']:  # Показываем последние 10
             date = datetime.fromisoformat(reward['reward_date']).strftime("%d.%m.%Y %H:%M")
             text += f"• {reward['reward_amount']:.2f} - {reward['chat_title']}\n"
             text += f"  <i>{date}</i>\n\n"
         
-        if len(rewards) > 10:
-            text += f"... и еще {len(rewards) - 10} вознаграждений"
+        if summary['count'] > len(summary['latest']):
+            text += f"... и еще {summary['count'] - len(summary['latest'])} вознаграждений"
         
         await message.answer(text, parse_mode="HTML")
         
@@ -128,6 +141,11 @@ async def chats_command(message: Message):
     """Команда /chats - список чатов"""
     await admin_commands.chats_command(message)
 
+@dp.callback_query(F.data.startswith("chats:") | (F.data == "refresh_chats"))
+async def chats_page_callback(callback: CallbackQuery):
+    """Кнопки навигации по списку чатов"""
+    await admin_commands.chats_page_callback(callback)
+
 @dp.message(Command("rewards"))
 async def rewards_command(message: Message):
     """Команда /rewards - список вознаграждений"""
@@ -143,6 +161,16 @@ async def user_rewards_command(message: Message):
     """Команда /user_rewards - вознаграждения конкретного пользователя"""
     await admin_commands.user_rewards_command(message)
 
+@dp.message(Command("cache_stats"))
+async def cache_stats_command(message: Message):
+    """Команда /cache_stats - счетчики кэша статистики"""
+    await admin_commands.cache_stats_command(message)
+
+@dp.message(Command("buffer_stats"))
+async def buffer_stats_command(message: Message):
+    """Команда /buffer_stats - состояние буфера записи активности"""
+    await admin_commands.buffer_stats_command(message)
+
 @dp.message(Command("admin_help"))
 async def admin_help_command(message: Message):
     """Команда /admin_help - справка по админ-командам"""
@@ -228,12 +256,12 @@ async def handle_message(message: Message):
         if message.chat.type == "private":
             return
         
-        # Обновляем активность пользователя в чате
-        await db.update_chat_activity(message.chat.id, message.from_user.id)
+        # Учитываем активность пользователя в чате (запись в БД - пакетами в фоне)
+        activity_buffer.record(message.chat.id, message.from_user.id)
+        activity_window.record(message.chat.id, message.from_user.id)
         
-        # Периодически анализируем чат (каждое 10-е сообщение)
-        if message.message_id % 10 == 0:
-            await analyze_and_reward_chat(message.chat.id)
+        # Отмечаем чат для фонового анализа (не чаще ANALYSIS_MIN_INTERVAL на чат)
+        analysis_scheduler.mark_dirty(message.chat.id)
             
     except Exception as e:
         logger.error(f"Ошибка обработки сообщения: {e}")
@@ -241,63 +269,140 @@ async def handle_message(message: Message):
 async def analyze_and_reward_chat(chat_id: int, added_by_user_id: int = None):
     """Анализ чата и выдача вознаграждения"""
     try:
-        # Получаем статистику чата
-        stats = await db.get_chat_stats(chat_id)
+        # Получаем статистику чата (из окон в памяти, без обращения к БД)
+        if activity_window.loaded:
+            stats = activity_window.get_chat_stats(chat_id)
+        else:
+            stats = await db.get_chat_stats(chat_id)
         
         # Рассчитываем ценность чата
         chat_value = analyzer.calculate_chat_value(stats)
         
         # Обновляем ценность в базе данных
         await db.update_chat_value(chat_id, chat_value)
+        activity_window.set_chat_info(chat_id, value=chat_value)
         
         # Если указан пользователь, который добавил бота, выдаем ему вознаграждение
         if added_by_user_id and chat_value > 0:
             reward_amount = chat_value * REWARD_COEFFICIENT
             
-            # Выдаем вознаграждение
-            success = await db.add_reward(added_by_user_id, chat_id, reward_amount)
-            
-            if success:
-                # Уведомляем пользователя о вознаграждении
-                try:
-                    await bot.send_message(
-                        added_by_user_id,
-                        f"🎉 <b>Получено вознаграждение!</b>\n\n"
-                        f"💰 Сумма: <b>{reward_amount:.2f}</b>\n"
-                        f"📊 Ценность чата: <b>{chat_value:.2f}</b>\n"
-                        f"👥 Активных пользователей: <b>{stats['active_users']}</b>\n"
-                        f"💬 Сообщений за сутки: <b>{stats['total_messages']}</b>\n\n"
-                        f"Спасибо за добавление активного чата!",
-                        parse_mode="HTML"
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить уведомление пользователю {added_by_user_id}: {e}")
+            # Выдаем вознаграждение; уведомление отправит notification_sender
+            await db.add_reward(added_by_user_id, chat_id, reward_amount, notification={
+                'chat_value': chat_value,
+                'active_users': stats['active_users'],
+                'total_messages': stats['total_messages']
+            })
         
-        logger.info(f"Анализ чата {chat_id}: ценность {chat_value}, активных {stats['active_users']}, сообщений {stats['total_messages']}")
+        logger.info("Анализ чата %s: ценность %s, активных %s, сообщений %s",
+                    chat_id, chat_value, stats['active_users'], stats['total_messages'])
         
     except Exception as e:
         logger.error(f"Ошибка анализа чата {chat_id}: {e}")
 
+analysis_scheduler = AnalysisScheduler(analyze_and_reward_chat)
+
+async def rollup_activity_periodically():
+    """Периодическая свертка почасовых корзин активности старше срока хранения"""
+    while True:
+        await db.rollup_activity_buckets()
+        await asyncio.sleep(ACTIVITY_ROLLUP_INTERVAL)
+
+# Фоновые задачи, запущенные start_services
+background_tasks = []
+
+async def start_services(background_jobs: bool = True, chat_filter: Callable[[int], bool] = None):
+    """
+    Запуск компонентов обработки обновлений (пул БД должен быть открыт, схема - актуальна)
+    
+    Args:
+        background_jobs: запускать ли задачи по всем чатам (переоценка, уведомления, свертка, резервные копии, очистка БД)
+        chat_filter: ограничение окон активности долей чатов рабочего процесса
+    """
+    # Запускаем фоновый сброс буфера активности
+    activity_buffer.start()
+    await activity_window.load(chat_filter)
+    if background_jobs:
+        revaluation_job.start()
+        notification_sender.start()
+        backup_job.start()
+        vacuum_job.start()
+        background_tasks.append(asyncio.create_task(rollup_activity_periodically()))
+
+async def stop_services():
+    """Остановка компонентов со сбросом буферов и закрытием соединений"""
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await analysis_scheduler.stop()
+    await revaluation_job.stop()
+    await notification_sender.stop()
+    await backup_job.stop()
+    await vacuum_job.stop()
+    await activity_buffer.stop()
+    await api_scheduler.stop()
+    await db.close()
+    await bot.session.close()
+
+async def run_front():
+    """
+    Входной процесс многопроцессного режима: применяет миграции и только распределяет
+    обновления, сервисы обработки запускают рабочие процессы
+    """
+    try:
+        try:
+            await db.init_db()
+            logger.info("База данных инициализирована")
+        finally:
+            # Соединения входного процесса не нужны рабочим процессам
+            await db.close()
+        
+        logger.info(f"Запуск бота с {SHARD_WORKERS} рабочими процессами...")
+        await run_sharded(bot, dp, SHARD_WORKERS)
+    
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}")
+    finally:
+        await bot.session.close()
+
 async def main():
     """Основная функция запуска бота"""
-    try:
-        # Проверяем наличие токена
-        if not BOT_TOKEN:
-            logger.error("BOT_TOKEN не установлен! Установите переменную окружения BOT_TOKEN")
-            return
+    # Проверяем наличие токена
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN не установлен! Установите переменную окружения BOT_TOKEN")
+        return
         
-        # Инициализируем базу данных
+    # Многопроцессный режим: этот процесс только принимает и распределяет обновления
+    if SHARD_WORKERS > 1:
+        await run_front()
+        return
+    
+    try:
+        # Открываем пул соединений и инициализируем базу данных
+        await db.open()
         await db.init_db()
         logger.info("База данных инициализирована")
         
+        await start_services()
+        
         # Запускаем бота
-        logger.info("Запуск бота...")
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            logger.info("Запуск бота в режиме webhook...")
+            await run_webhook(dp, bot)
+        else:
+            logger.info("Запуск бота...")
+            # Webhook, оставшийся от запуска в режиме webhook, мешает getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
-        await bot.session.close()
+        await stop_services()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Настройка логирования (запись на диск - в фоновом потоке)
+    setup_logging()
+    try:
+        asyncio.run(main())
+    finally:
+        shutdown_logging()
\ No newline at end of file
@@ -3,6 +3,12 @@ from datetime import datetime, timedelta
 from typing import Dict
 from config import MIN_CHAT_VALUE, MAX_CHAT_VALUE
 
+# NumPy нужен только для пакетного (векторизованного) анализа
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 logger = logging.getLogger(__name__)
 
 class ChatAnalyzer:
@@ -40,7 +46,7 @@ class ChatAnalyzer:
                 
                 # Если активных пользователей меньше 5% от общего количества - подозрительно
                 if activity_ratio < 0.05:
-                    logger.warning(f"Подозрительно низкая активность: {activity_ratio:.2%}")
+                    logger.warning("Подозрительно низкая активность: %.2f%%", activity_ratio * 100)
                     # Снижаем ценность
                     activity_penalty = activity_ratio * 2  # Максимум 10% от обычной ценности
                 else:
@@ -69,9 +75,9 @@ class ChatAnalyzer:
             # Ограничиваем значение в заданных пределах
             final_value = max(self.min_value, min(final_value, self.max_value))
             
-            logger.info(f"Ценность чата: {final_value:.2f} "
-                       f"(активных: {active_users}, сообщений: {total_messages}, "
-                       f"участников: {member_count}, вовлеченность: {engagement_ratio:.2f})")
+            # Вызывается на горячем пути: DEBUG и отложенное форматирование
+            logger.debug("Ценность чата: %.2f (активных: %s, сообщений: %s, участников: %s, вовлеченность: %.2f)",
+                         final_value, active_users, total_messages, member_count, engagement_ratio)
             
             return round(final_value, 2)
             
@@ -199,4 +205,119 @@ class ChatAnalyzer:
         if not recommendations:
             recommendations.append("Чат в хорошем состоянии, продолжайте в том же духе!")
         
-        return recommendations
\ No newline at end of file
+        return recommendations
+    
+    # Пакетный анализ: те же правила, что и в скалярных методах, но для массивов чатов.
+    # Результаты совпадают со скалярными версиями поэлементно.
+    
+    @staticmethod
+    def _as_arrays(active_users, total_messages, member_count):
+        """Приведение столбцов статистики к массивам float64 одинаковой формы"""
+        if np is None:
+            raise RuntimeError("Для пакетного анализа требуется NumPy (pip install numpy)")
+        return np.broadcast_arrays(
+            np.asarray(active_users, dtype=np.float64),
+            np.asarray(total_messages, dtype=np.float64),
+            np.asarray(member_count, dtype=np.float64)
+        )
+    
+    @staticmethod
+    def _ratios(active_users, total_messages, member_count):
+        """Вовлеченность (сообщений на активного) и доля активных; 0 при нулевом знаменателе"""
+        engagement_ratio = np.divide(total_messages, active_users,
+                                     out=np.zeros_like(total_messages), where=active_users > 0)
+        activity_ratio = np.divide(active_users, member_count,
+                                   out=np.zeros_like(active_users), where=member_count > 0)
+        return engagement_ratio, activity_ratio
+    
+    @staticmethod
+    def _round2(values):
+        """Округление до 2 знаков, совпадающее со встроенным round()"""
+        rounded = np.round(values, 2)
+        # np.round и round() могут расходиться только на значениях, близких к середине
+        scaled = values * 100
+        ambiguous = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        for index in np.flatnonzero(ambiguous):
+            rounded.flat[index] = round(float(values.flat[index]), 2)
+        return rounded
+    
+    def calculate_chat_values(self, active_users, total_messages, member_count):
+        """
+        Пакетный расчет ценности чатов (векторизованный calculate_chat_value)
+        
+        Args:
+            active_users: массив активных пользователей за сутки
+            total_messages: массив сообщений за сутки
+            member_count: массив участников чатов
+        
+        Returns:
+            np.ndarray: ценности чатов
+        """
+        active_users, total_messages, member_count = self._as_arrays(active_users, total_messages, member_count)
+        engagement_ratio, activity_ratio = self._ratios(active_users, total_messages, member_count)
+        
+        # Защита от накрутки: меньше 5% активных снижает ценность
+        activity_penalty = np.where((member_count > 0) & (activity_ratio < 0.05), activity_ratio * 2, 1.0)
+        
+        base_value = (active_users * 2) + (total_messages * 0.5)
+        engagement_bonus = np.select([engagement_ratio > 10, engagement_ratio > 5], [1.5, 1.2], 1.0)
+        
+        final_value = base_value * engagement_bonus * activity_penalty
+        final_value = np.maximum(self.min_value, np.minimum(final_value, self.max_value))
+        final_value = self._round2(final_value)
+        
+        # Без активности ценность минимальная
+        no_activity = (active_users == 0) | (total_messages == 0)
+        return np.where(no_activity, self.min_value, final_value)
+    
+    def get_engagement_levels(self, active_users, total_messages, member_count):
+        """Пакетное определение уровня вовлеченности (векторизованный get_engagement_level)"""
+        active_users, total_messages, member_count = self._as_arrays(active_users, total_messages, member_count)
+        engagement_ratio, activity_ratio = self._ratios(active_users, total_messages, member_count)
+        
+        return np.select(
+            [
+                (active_users == 0) | (total_messages == 0),
+                (engagement_ratio > 15) & (activity_ratio > 0.3),
+                (engagement_ratio > 10) & (activity_ratio > 0.2),
+                (engagement_ratio > 5) & (activity_ratio > 0.1),
+                (engagement_ratio > 2) & (activity_ratio > 0.05),
+            ],
+            ["Нет активности", "Очень высокая", "Высокая", "Средняя", "Низкая"],
+            "Очень низкая"
+        ).astype(object)
+    
+    def calculate_health_scores(self, active_users, total_messages, member_count):
+        """Пакетная оценка здоровья чатов 0-100 (как health_score в analyze_chat_health)"""
+        active_users, total_messages, member_count = self._as_arrays(active_users, total_messages, member_count)
+        engagement_ratio, activity_ratio = self._ratios(active_users, total_messages, member_count)
+        
+        activity_score = np.select(
+            [activity_ratio > 0.3, activity_ratio > 0.2, activity_ratio > 0.1, activity_ratio > 0.05],
+            [40, 30, 20, 10], 0
+        )
+        engagement_score = np.select(
+            [engagement_ratio > 15, engagement_ratio > 10, engagement_ratio > 5, engagement_ratio > 2],
+            [40, 30, 20, 10], 0
+        )
+        messages_score = np.select(
+            [total_messages > 100, total_messages > 50, total_messages > 20, total_messages > 5],
+            [20, 15, 10, 5], 0
+        )
+        return (activity_score + engagement_score + messages_score).astype(np.int64)
+    
+    def analyze_chats_batch(self, active_users, total_messages, member_count) -> Dict:
+        """Пакетный анализ чатов: ценность, уровень вовлеченности, оценка и состояние здоровья"""
+        health_scores = self.calculate_health_scores(active_users, total_messages, member_count)
+        health_statuses = np.select(
+            [health_scores >= 80, health_scores >= 60, health_scores >= 40, health_scores >= 20],
+            ["Отличное", "Хорошее", "Удовлетворительное", "Плохое"],
+            "Критическое"
+        ).astype(object)
+        
+        return {
+            'value': self.calculate_chat_values(active_users, total_messages, member_count),
+            'engagement_level': self.get_engagement_levels(active_users, total_messages, member_count),
+            'health_score': health_scores,
+            'health_status': health_statuses
+        }
@@ -17,8 +17,99 @@ try:
 except ValueError:
     ADMIN_ID: Optional[int] = None
 
+# Режим webhook: если задан публичный адрес WEBHOOK_URL, бот принимает обновления
+# через встроенный HTTP-сервер вместо long polling
+WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+try:
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8080'))
+except ValueError:
+    WEBHOOK_PORT: int = 8080
+WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_MAX_CONNECTIONS = 40      # Одновременных соединений от Telegram
+WEBHOOK_MAX_IN_FLIGHT = 200       # Обновлений в обработке, после чего прием замедляется
+WEBHOOK_ACQUIRE_TIMEOUT = 5.0     # Ожидание свободного слота до ответа 503, секунд
+
+# Многопроцессный режим: при SHARD_WORKERS > 1 обновления распределяются
+# по рабочим процессам по chat_id
+try:
+    SHARD_WORKERS: int = int(os.getenv('SHARD_WORKERS', '0'))
+except ValueError:
+    SHARD_WORKERS: int = 0
+SHARD_QUEUE_SIZE = 1000          # Обновлений в очереди одного процесса
+SHARD_STATS_INTERVAL = 60.0      # Интервал отправки метрик процессами, секунд
+SHARD_SHUTDOWN_TIMEOUT = 30.0    # Ожидание остановки процессов, секунд
+
 # Настройки базы данных
 DATABASE_PATH = 'bot_database.db'
+DB_POOL_SIZE = 4              # Количество постоянных соединений в пуле
+DB_JOURNAL_MODE = 'WAL'       # Режим журнала SQLite
+DB_SYNCHRONOUS = 'NORMAL'     # Уровень синхронизации (NORMAL безопасен в режиме WAL)
+DB_CACHE_SIZE = -20000        # Размер кэша страниц (отрицательное значение - в КиБ)
+DB_MMAP_SIZE = 268435456      # Размер memory-mapped I/O в байтах (256 МБ)
+DB_BUSY_TIMEOUT = 5000        # Ожидание снятия блокировки, мс
+DB_STATEMENT_CACHE_SIZE = 256 # Кэш подготовленных операторов на соединение
+DB_AUTO_VACUUM = 'INCREMENTAL' # Режим auto_vacuum для новых баз (существующие - maintenance.py optimize --convert)
+
+# Инкрементальная очистка свободных страниц (вместо блокирующего VACUUM)
+VACUUM_INTERVAL = 3600.0       # Интервал очистки по расписанию, секунд
+VACUUM_PAGES_PER_RUN = 2000    # Максимум освобождаемых страниц за один проход
+VACUUM_ANALYSIS_LIMIT = 400    # Строк на индекс при сборе статистики PRAGMA optimize
+
+# Резервное копирование
+BACKUP_DIR = 'backups'           # Каталог резервных копий
+BACKUP_INTERVAL = 24 * 3600.0    # Интервал копирования по расписанию, секунд
+BACKUP_KEEP = 7                  # Количество хранимых копий
+BACKUP_COMPRESS = True           # Сжимать копии gzip (временно нужно место и на несжатую копию)
+BACKUP_PAGES_PER_STEP = 256      # Страниц за один шаг копирования
+BACKUP_STEP_SLEEP = 0.005        # Пауза после каждого шага (ограничивает нагрузку копирования на диск), секунд
+
+# Экспорт в CSV
+EXPORT_DIR = 'exports'      # Каталог экспорта
+EXPORT_CHUNK_SIZE = 5000    # Строк, читаемых из базы за раз
+
+# Удаление устаревшей активности (maintenance.py cleanup)
+CLEANUP_BATCH_SIZE = 5000           # Начальный диапазон id за одну транзакцию
+CLEANUP_BATCH_MIN = 100             # Границы диапазона при подстройке под бюджет времени
+CLEANUP_BATCH_MAX = 100000
+CLEANUP_BATCH_TIME_BUDGET = 0.05    # Целевая длительность транзакции (блокировки записи), секунд
+CLEANUP_BATCH_PAUSE = 0.01          # Пауза между транзакциями для других записывающих, секунд
+
+# Настройки буфера отложенной записи активности
+ACTIVITY_FLUSH_INTERVAL = 2.0     # Интервал сброса буфера в БД, секунд
+ACTIVITY_FLUSH_MAX_SIZE = 1000    # Досрочный сброс при таком количестве пар (чат, пользователь)
+ACTIVITY_FLUSH_MAX_ATTEMPTS = 5   # Попыток записи пакета, после которых он отбрасывается
+
+# Почасовые корзины активности
+ACTIVITY_BUCKET_RETENTION_DAYS = 8   # Срок хранения почасовых корзин (окно 7d должно помещаться)
+ACTIVITY_ROLLUP_INTERVAL = 3600      # Интервал свертки старых корзин в суточные, секунд
+ACTIVITY_WINDOW_HOURS = 24           # Окно статистики чата для анализа (в памяти), часов
+
+# Планировщик анализа чатов
+ANALYSIS_MIN_INTERVAL = 60.0    # Минимальный интервал между анализами одного чата, секунд
+ANALYSIS_MAX_CONCURRENCY = 4    # Максимум одновременно выполняющихся анализов
+REVALUATION_INTERVAL = 900.0    # Интервал массовой переоценки всех чатов, секунд
+
+# Кэш ответов административной статистики (время жизни записей, секунд)
+CACHE_MAX_SIZE = 256       # Максимум записей в кэше
+CACHE_TTL_STATS = 30.0     # Общая статистика
+CACHE_TTL_CHATS = 15.0     # Топ и страницы списка чатов
+CACHE_TTL_REWARDS = 30.0   # Сводка и последние вознаграждения
+
+# Очередь уведомлений о вознаграждениях
+NOTIFY_INTERVAL = 30.0      # Интервал отправки (уведомления за интервал объединяются), секунд
+NOTIFY_BATCH_SIZE = 500     # Максимум уведомлений за один проход
+NOTIFY_MAX_ATTEMPTS = 5     # Попыток отправки до отметки failed
+NOTIFY_RETRY_BASE = 30.0    # Начальная задержка повтора (удваивается с каждой попыткой), секунд
+NOTIFY_RETRY_MAX = 3600.0   # Максимальная задержка повтора, секунд
+
+# Ограничение частоты запросов к Bot API
+API_GLOBAL_RATE = 30.0         # Запросов в секунду на бота
+API_CHAT_RATE = 1.0            # Запросов в секунду в личный чат
+API_GROUP_RATE = 20.0 / 60.0   # Запросов в секунду в группу или канал
+API_CHAT_BURST = 1             # Запросов подряд в один чат без ожидания
+API_MAX_RETRIES = 3            # Повторов запроса после ответа 429 (retry_after)
 
 # Коэффициенты для расчета вознаграждений
 REWARD_COEFFICIENT = 0.1  # Базовый коэффициент вознаграждения
@@ -27,4 +118,10 @@ MAX_CHAT_VALUE = 100.0    # Максимальная ценность чата
 
 # Настройки логирования
 LOG_LEVEL = 'INFO'
-LOG_FILE = 'bot.log'
\ No newline at end of file
+LOG_FILE = 'bot.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Ротация файла лога по размеру
+LOG_BACKUP_COUNT = 5              # Количество хранимых архивов лога
+
+# Административные команды
+CHATS_PAGE_SIZE = 10  # Количество чатов на странице /chats
+ANALYZE_MAX_WINDOW_DAYS = 365  # Максимальное окно /analyze_chat, дней
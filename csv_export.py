@@ -0,0 +1,157 @@
+"""
+Потоковый экспорт таблиц в CSV (полный и инкрементальный)
+"""
+
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import DATABASE_PATH, EXPORT_DIR, EXPORT_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Экспортируемые таблицы и столбец водяного знака для инкрементального экспорта.
+# В инкрементальный файл попадают строки со значением столбца больше сохраненного: новые
+# вознаграждения, а также пользователи, чаты и записи активности, добавленные или измененные
+# после экспорта (одна строка может попасть в несколько файлов - последняя версия актуальна).
+# Оба столбца растут в порядке фиксации транзакций (change_seq ведется триггерами, см.
+# миграцию 13), поэтому строка, зафиксированная после экспорта, не окажется ниже водяного знака.
+EXPORT_TABLES = {
+    'users': 'change_seq',
+    'chats': 'change_seq',
+    'rewards': 'id',
+    'chat_activity': 'change_seq'
+}
+
+# Файл с водяными знаками в каталоге экспорта
+WATERMARKS_FILE = 'watermarks.json'
+
+# Степень сжатия gzip
+_COMPRESS_LEVEL = 6
+
+def load_watermarks(output_dir: str) -> Dict:
+    """Сохраненные водяные знаки каталога экспорта"""
+    path = os.path.join(output_dir, WATERMARKS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_watermarks(output_dir: str, watermarks: Dict):
+    """Запись водяных знаков (через временный файл, чтобы не оставить его поврежденным)"""
+    path = os.path.join(output_dir, WATERMARKS_FILE)
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.part', path)
+
+def _open_output(path: str, compress: bool):
+    """Текстовый файл для записи CSV, при compress - со сжатием gzip"""
+    if compress:
+        return gzip.open(path, 'wt', compresslevel=_COMPRESS_LEVEL, newline='', encoding='utf-8')
+    return open(path, 'w', newline='', encoding='utf-8')
+
+def _export_table(db_path: str, table: str, path: str, compress: bool, chunk_size: int,
+                  watermark_column: Optional[str] = None, watermark=None) -> Dict:
+    """
+    Экспорт таблицы частями по chunk_size строк (выполняется в отдельном потоке)
+    
+    Чтение идет в одной транзакции: в режиме WAL файл согласован на момент ее начала и не
+    блокирует запись. Файл пишется во временный и переименовывается, только если в нем есть строки.
+    
+    Returns:
+        число строк и новое значение водяного знака
+    """
+    query = f"SELECT * FROM {table}"
+    params = ()
+    if watermark_column and watermark is not None:
+        query += f" WHERE {watermark_column} > ?"
+        params = (watermark,)
+    
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+    part_path = path + '.part'
+    rows = 0
+    try:
+        conn.execute("BEGIN")
+        cursor = conn.execute(query, params)
+        columns = [column[0] for column in cursor.description]
+        watermark_index = columns.index(watermark_column) if watermark_column else None
+        
+        with _open_output(part_path, compress) as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                rows += len(chunk)
+                if watermark_index is not None:
+                    chunk_max = max(row[watermark_index] for row in chunk)
+                    if watermark is None or chunk_max > watermark:
+                        watermark = chunk_max
+        conn.execute("ROLLBACK")
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    finally:
+        conn.close()
+    
+    if rows:
+        os.replace(part_path, path)
+    else:
+        os.remove(part_path)
+    return {'rows': rows, 'watermark': watermark}
+
+async def export_tables(db_path: str = DATABASE_PATH, output_dir: str = EXPORT_DIR, compress: bool = False,
+                        incremental: bool = False, chunk_size: int = EXPORT_CHUNK_SIZE) -> Dict:
+    """
+    Экспорт таблиц EXPORT_TABLES в CSV без загрузки таблиц в память
+    
+    Полный экспорт перезаписывает {table}.csv. Инкрементальный пишет в {table}_{время}.csv
+    только строки после сохраненного водяного знака и сдвигает его после записи файла.
+    
+    Returns:
+        по каждой таблице: путь, число строк, длительность и скорость (строк в секунду)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    watermarks = load_watermarks(output_dir) if incremental else {}
+    suffix = datetime.now().strftime("_%Y%m%d_%H%M%S") if incremental else ""
+    extension = ".csv.gz" if compress else ".csv"
+    
+    results = {}
+    for table, watermark_column in EXPORT_TABLES.items():
+        watermark = watermarks.get(table)
+        if watermark is not None and not isinstance(watermark, int):
+            # Водяной знак по дате из прежних версий не сравним с порядковым номером
+            logger.warning(f"Водяной знак таблицы {table} в устаревшем формате ({watermark}), таблица выгружается полностью")
+            watermark = None
+        
+        path = os.path.join(output_dir, f"{table}{suffix}{extension}")
+        start = time.perf_counter()
+        result = await asyncio.to_thread(
+            _export_table, db_path, table, path, compress, chunk_size,
+            watermark_column if incremental else None, watermark
+        )
+        duration = time.perf_counter() - start
+        
+        if incremental and result['rows']:
+            watermarks[table] = result['watermark']
+            save_watermarks(output_dir, watermarks)
+        
+        results[table] = {
+            'path': path if result['rows'] else None,
+            'rows': result['rows'],
+            'duration': round(duration, 3),
+            'rows_per_sec': round(result['rows'] / duration, 1) if duration > 0 else 0.0
+        }
+        if result['rows']:
+            logger.info(f"Экспортировано {result['rows']} записей в {path} ({results[table]['rows_per_sec']:.0f} строк/с)")
+    return results
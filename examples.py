@@ -73,6 +73,7 @@ async def example_usage():
     print(f"   База данных: {'✅ Доступна' if health['database_accessible'] else '❌ Недоступна'}")
     print(f"   Таблицы: {'✅ Существуют' if health['tables_exist'] else '❌ Отсутствуют'}")
     
+    await db.close()
     print("\n✅ Примеры выполнены!")
 
 def example_config():
@@ -121,6 +122,9 @@ python maintenance.py optimize
 # Экспорт данных в CSV
 python maintenance.py export
 
+# Экспорт только новых строк со сжатием gzip
+python maintenance.py export --incremental --compress
+
 # Проверка здоровья системы
 python maintenance.py health
 
@@ -22,7 +22,10 @@ async def init_database():
         db = Database(DATABASE_PATH)
         
         # Инициализируем базу данных
-        await db.init_db()
+        try:
+            await db.init_db()
+        finally:
+            await db.close()
         
         print(f"✅ База данных успешно инициализирована: {DATABASE_PATH}")
         
@@ -0,0 +1,78 @@
+"""
+Неблокирующая настройка логирования: запись на диск в отдельном потоке
+"""
+
+import logging
+import logging.handlers
+import queue
+import sys
+from pathlib import Path
+from typing import Optional
+
+from config import LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(log_file: str = LOG_FILE, level: str = LOG_LEVEL,
+                  max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT,
+                  stream=sys.stdout) -> logging.handlers.QueueListener:
+    """
+    Настройка логирования через очередь
+    
+    Обработчики корневого логгера только кладут записи в очередь, а форматирование
+    и запись в файл (с ротацией по размеру) и в консоль выполняет фоновый поток
+    QueueListener, поэтому цикл событий не блокируется на дисковом вводе-выводе.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    
+    Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+    
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    return _listener
+
+def shutdown_logging():
+    """Остановка фонового потока с записью оставшихся сообщений"""
+    global _listener
+    if _listener is None:
+        return
+    
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+def setup_worker_logging(log_queue, level: str = LOG_LEVEL):
+    """Логирование в дочернем процессе: записи передаются входному процессу через log_queue"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+def start_worker_log_forwarding(log_queue) -> logging.handlers.QueueListener:
+    """Передача записей дочерних процессов обработчикам корневого логгера текущего процесса"""
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers)
+    listener.start()
+    return listener
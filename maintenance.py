@@ -5,67 +5,96 @@
 
 import asyncio
 import sys
+import time
 import argparse
 from pathlib import Path
 
 # Добавляем текущую директорию в путь для импорта модулей
 sys.path.insert(0, str(Path(__file__).parent))
 
-from utils import BotUtils
+from utils import BotUtils, format_file_size
 from database import Database
-from config import DATABASE_PATH
+from config import DATABASE_PATH, EXPORT_DIR, VACUUM_PAGES_PER_RUN
 
 async def cleanup_old_data(days: int = 7):
     """Очистка старых данных"""
     print(f"🧹 Очистка данных старше {days} дней...")
     
     utils = BotUtils()
-    deleted_count = await utils.cleanup_old_activity(days)
+    try:
+        result = await utils.cleanup_old_activity(days)
+    finally:
+        await utils.db.close()
     
-    print(f"✅ Удалено {deleted_count} старых записей")
-    return deleted_count
+    print(f"✅ Удалено {result['deleted']} старых записей за {result['duration']:.2f} с")
+    print(f"   🔁 Транзакций: {result['batches']}, самая долгая: {result['max_batch_ms']:.1f} мс")
+    return result['deleted']
 
-async def create_backup():
+async def create_backup(compress: bool = False):
     """Создание резервной копии"""
     print("💾 Создание резервной копии...")
     
     utils = BotUtils()
-    backup_path = await utils.backup_database()
-    
-    if backup_path:
-        print(f"✅ Резервная копия создана: {backup_path}")
+    result = await utils.backup_database(compress=compress, probe=True)
+    
+    if result:
+        print(f"✅ Резервная копия создана: {result['path']} ({format_file_size(result['size'])})")
+        print(f"   📄 Страниц: {result['pages']} за {result['duration']:.2f} с "
+              f"({result['pages_per_sec']:.0f} стр/с, шагов: {result['steps']})")
+        print(f"   ⏱️  Ожидание записи в базу: до {result['write_stall_ms']:.1f} мс, "
+              f"задержка цикла событий: до {result['loop_stall_ms']:.1f} мс")
     else:
         print("❌ Ошибка создания резервной копии")
     
-    return backup_path
+    return result
 
-async def optimize_database():
-    """Оптимизация базы данных"""
+async def optimize_database(convert: bool = False, pages: int = VACUUM_PAGES_PER_RUN):
+    """Оптимизация базы данных (PRAGMA optimize и инкрементальная очистка свободных страниц)"""
     print("⚡ Оптимизация базы данных...")
+    if convert:
+        print("🔄 Перевод в режим auto_vacuum=INCREMENTAL (полный VACUUM, запись блокируется)...")
     
     utils = BotUtils()
-    success = await utils.optimize_database()
-    
-    if success:
-        print("✅ База данных оптимизирована")
+    try:
+        result = await utils.optimize_database(convert, pages)
+    finally:
+        await utils.db.close()
+    
+    if result:
+        print(f"✅ База данных оптимизирована (auto_vacuum={result['auto_vacuum']})")
+        if 'converted_bytes' in result:
+            print(f"   🔄 Освобождено при переводе: {format_file_size(result['converted_bytes'])}")
+        print(f"   🧹 Свободных страниц: {result['freelist_before']} → {result['freelist_after']}, "
+              f"освобождено {format_file_size(result['bytes_reclaimed'])} за {result['duration_ms']:.1f} мс")
+        print(f"   📦 Файл: {format_file_size(result['file_size'])}, "
+              f"свободно внутри: {format_file_size(result['freelist_bytes'])}")
+        if result['auto_vacuum'] != 'INCREMENTAL' and result['freelist_bytes']:
+            print("   💡 Для освобождения места выполните: maintenance.py optimize --convert")
     else:
         print("❌ Ошибка оптимизации базы данных")
     
-    return success
+    return result
 
-async def export_data():
+async def export_data(output_dir: str = EXPORT_DIR, compress: bool = False, incremental: bool = False):
     """Экспорт данных"""
-    print("📤 Экспорт данных...")
+    mode = "инкрементальный" if incremental else "полный"
+    print(f"📤 Экспорт данных ({mode})...")
     
     utils = BotUtils()
-    success = await utils.export_data_to_csv()
-    
-    if success:
-        print("✅ Данные экспортированы в папку exports/")
+    results = await utils.export_data_to_csv(output_dir, compress=compress, incremental=incremental)
+    
+    if results is not None:
+        for table, result in results.items():
+            if result['rows']:
+                print(f"   📄 {table}: {result['rows']} строк за {result['duration']:.2f} с "
+                      f"({result['rows_per_sec']:.0f} строк/с) -> {result['path']}")
+            else:
+                print(f"   📄 {table}: нет новых строк")
+        print(f"✅ Данные экспортированы в папку {output_dir}/")
     else:
         print("❌ Ошибка экспорта данных")
     
-    return success
+    return results
 
 async def health_check():
     """Проверка здоровья системы"""
@@ -86,35 +115,80 @@ async def health_check():
     
     return health['overall_health']
 
-async def show_stats():
+async def show_stats(sizes: bool = False):
     """Показать статистику"""
     print("📊 Статистика системы...")
     
     utils = BotUtils()
-    stats = await utils.get_database_stats()
-    
-    if stats:
-        print(f"📁 Размер БД: {utils.format_file_size(stats['file_size'])}")
-        print(f"👥 Пользователей: {stats.get('users_count', 0)}")
-        print(f"💬 Чатов: {stats.get('chats_count', 0)}")
-        print(f"💰 Вознаграждений: {stats.get('rewards_count', 0)}")
-        print(f"📝 Записей активности: {stats.get('chat_activity_count', 0)}")
+    try:
+        start = time.perf_counter()
+        stats = await utils.get_database_stats()
+        elapsed_ms = (time.perf_counter() - start) * 1000
         
-        if stats.get('first_user_date'):
-            print(f"📅 Первый пользователь: {stats['first_user_date']}")
-        if stats.get('last_user_date'):
-            print(f"📅 Последний пользователь: {stats['last_user_date']}")
-    else:
-        print("❌ Ошибка получения статистики")
+        if stats:
+            estimated = stats.get('estimated', [])
+            
+            def count(table: str) -> str:
+                value = stats.get(f'{table}_count', 0)
+                return f"~{value}" if table in estimated else str(value)
+            
+            print(f"📁 Размер БД: {format_file_size(stats['file_size'])}")
+            print(f"👥 Пользователей: {count('users')}")
+            print(f"💬 Чатов: {count('chats')}")
+            print(f"💰 Вознаграждений: {count('rewards')}")
+            print(f"📝 Записей активности: {count('chat_activity')}")
+        
+            if stats.get('first_user_date'):
+                print(f"📅 Первый пользователь: {stats['first_user_date']}")
+            if stats.get('last_user_date'):
+                print(f"📅 Последний пользователь: {stats['last_user_date']}")
+            print(f"⏱️  Получено за {elapsed_ms:.1f} мс")
+        else:
+            print("❌ Ошибка получения статистики")
+        
+        if sizes:
+            print("\n📦 Размер таблиц и индексов (dbstat, читает весь файл):")
+            for name, size in (await utils.db.get_table_sizes()).items():
+                print(f"   • {name}: {format_file_size(size)}")
+    finally:
+        await utils.db.close()
+
+async def explain_queries():
+    """Планы выполнения запросов горячего пути"""
+    print("🔎 Планы выполнения запросов (EXPLAIN QUERY PLAN)...")
+    
+    db = Database(DATABASE_PATH)
+    try:
+        await db.init_db()
+        print(f"🗂  Версия схемы: {await db.get_schema_version()}")
+        
+        for name, plan in (await db.explain_hot_queries()).items():
+            print(f"\n📄 {name}:")
+            for step in plan:
+                print(f"   • {step}")
+    finally:
+        await db.close()
 
 def main():
     """Основная функция"""
     parser = argparse.ArgumentParser(description="Скрипт обслуживания Reward Bot")
     parser.add_argument('action', choices=[
-        'cleanup', 'backup', 'optimize', 'export', 'health', 'stats', 'all'
+        'cleanup', 'backup', 'optimize', 'export', 'health', 'stats', 'explain', 'all'
     ], help='Действие для выполнения')
     parser.add_argument('--days', type=int, default=7, 
                        help='Количество дней для очистки (по умолчанию: 7)')
+    parser.add_argument('--compress', action='store_true',
+                       help='Сжать резервную копию или файлы экспорта gzip')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Экспортировать только строки, добавленные или измененные после прошлого экспорта')
+    parser.add_argument('--sizes', action='store_true',
+                       help='Показать размер таблиц и индексов (dbstat, медленно на большой базе)')
+    parser.add_argument('--output', default=EXPORT_DIR,
+                       help=f'Каталог экспорта (по умолчанию: {EXPORT_DIR})')
+    parser.add_argument('--convert', action='store_true',
+                       help='Перевести базу в режим auto_vacuum=INCREMENTAL (однократный полный VACUUM)')
+    parser.add_argument('--pages', type=int, default=VACUUM_PAGES_PER_RUN,
+                       help=f'Максимум освобождаемых страниц за проход (по умолчанию: {VACUUM_PAGES_PER_RUN})')
     
     args = parser.parse_args()
     
@@ -123,21 +197,23 @@ def main():
             if args.action == 'cleanup':
                 await cleanup_old_data(args.days)
             elif args.action == 'backup':
-                await create_backup()
+                await create_backup(args.compress)
             elif args.action == 'optimize':
-                await optimize_database()
+                await optimize_database(args.convert, args.pages)
             elif args.action == 'export':
-                await export_data()
+                await export_data(args.output, args.compress, args.incremental)
             elif args.action == 'health':
                 await health_check()
             elif args.action == 'stats':
-                await show_stats()
+                await show_stats(args.sizes)
+            elif args.action == 'explain':
+                await explain_queries()
             elif args.action == 'all':
                 print("🔄 Выполнение полного обслуживания...")
                 await health_check()
-                await create_backup()
+                await create_backup(args.compress)
                 await cleanup_old_data(args.days)
-                await optimize_database()
+                await optimize_database(args.convert, args.pages)
                 await show_stats()
                 print("✅ Полное обслуживание завершено")
                 
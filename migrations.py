@@ -0,0 +1,524 @@
+"""
+Версионированные миграции схемы базы данных
+"""
+
+import logging
+from datetime import datetime
+from typing import List
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Упорядоченный список миграций: (версия, описание, SQL-операторы).
+# Уже примененные миграции не изменяются - новые изменения схемы добавляются в конец.
+MIGRATIONS = [
+    (1, "Базовые таблицы", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            registration_date TEXT NOT NULL,
+            total_rewards REAL DEFAULT 0.0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            title TEXT,
+            added_date TEXT NOT NULL,
+            value REAL DEFAULT 0.0,
+            member_count INTEGER DEFAULT 0,
+            last_activity_date TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rewards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            reward_amount REAL NOT NULL,
+            reward_date TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_count INTEGER DEFAULT 1,
+            last_message_date TEXT NOT NULL,
+            FOREIGN KEY (chat_id) REFERENCES chats (chat_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+    ]),
+    (2, "Уникальность (chat_id, user_id) и индекс по дате в chat_activity", [
+        # Схлопываем дубликаты, накопившиеся без ограничения уникальности
+        '''
+        UPDATE chat_activity SET
+            message_count = (
+                SELECT SUM(a.message_count) FROM chat_activity a
+                WHERE a.chat_id = chat_activity.chat_id AND a.user_id = chat_activity.user_id
+            ),
+            last_message_date = (
+                SELECT MAX(a.last_message_date) FROM chat_activity a
+                WHERE a.chat_id = chat_activity.chat_id AND a.user_id = chat_activity.user_id
+            )
+        WHERE id IN (
+            SELECT MIN(id) FROM chat_activity GROUP BY chat_id, user_id HAVING COUNT(*) > 1
+        )
+        ''',
+        '''
+        DELETE FROM chat_activity WHERE id NOT IN (
+            SELECT MIN(id) FROM chat_activity GROUP BY chat_id, user_id
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_activity_chat_user
+        ON chat_activity (chat_id, user_id)
+        ''',
+        # Покрывающий индекс для статистики чата за период
+        '''
+        CREATE INDEX IF NOT EXISTS idx_chat_activity_chat_date
+        ON chat_activity (chat_id, last_message_date, user_id, message_count)
+        ''',
+    ]),
+    (3, "Почасовые и суточные корзины активности", [
+        # Почасовые корзины: hour - номер часа с начала эпохи Unix (timestamp // 3600)
+        '''
+        CREATE TABLE IF NOT EXISTS chat_activity_hourly (
+            chat_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, hour, user_id)
+        ) WITHOUT ROWID
+        ''',
+        # Суточные корзины для корзин старше срока хранения: day - номер суток (hour // 24)
+        '''
+        CREATE TABLE IF NOT EXISTS chat_activity_daily (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day, user_id)
+        ) WITHOUT ROWID
+        ''',
+        # Для свертки старых корзин по всем чатам
+        '''
+        CREATE INDEX IF NOT EXISTS idx_chat_activity_hourly_hour
+        ON chat_activity_hourly (hour)
+        ''',
+    ]),
+    (4, "Индекс по ценности чатов для топа", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_chats_value
+        ON chats (value DESC)
+        ''',
+    ]),
+    (5, "Сводка вознаграждений пользователя", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_rewards_user_date
+        ON rewards (user_id, reward_date)
+        ''',
+        '''
+        ALTER TABLE users ADD COLUMN reward_count INTEGER DEFAULT 0
+        ''',
+        # Сверяем счетчики пользователей с журналом вознаграждений
+        '''
+        UPDATE users SET
+            reward_count = (SELECT COUNT(*) FROM rewards r WHERE r.user_id = users.user_id),
+            total_rewards = COALESCE((SELECT SUM(reward_amount) FROM rewards r WHERE r.user_id = users.user_id), 0.0)
+        ''',
+    ]),
+    (6, "Материализованная сводка вознаграждений", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_rewards_date
+        ON rewards (reward_date)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_rewards_chat
+        ON rewards (chat_id)
+        ''',
+        # Единственная строка (id = 1), обновляется в add_reward
+        '''
+        CREATE TABLE IF NOT EXISTS reward_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_amount REAL NOT NULL DEFAULT 0.0,
+            reward_count INTEGER NOT NULL DEFAULT 0,
+            unique_users INTEGER NOT NULL DEFAULT 0,
+            unique_chats INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO reward_summary (id, total_amount, reward_count, unique_users, unique_chats)
+        SELECT 1, COALESCE(SUM(reward_amount), 0.0), COUNT(*), COUNT(DISTINCT user_id), COUNT(DISTINCT chat_id)
+        FROM rewards
+        ''',
+    ]),
+    (7, "Составной индекс (value, chat_id) для постраничного списка чатов", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_chats_value_id
+        ON chats (value, chat_id)
+        ''',
+        # Новый индекс покрывает и топ чатов
+        '''
+        DROP INDEX IF EXISTS idx_chats_value
+        ''',
+    ]),
+    (8, "Очередь уведомлений о вознаграждениях", [
+        # status: pending - ожидает отправки, sent - отправлено, failed - попытки исчерпаны
+        '''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            reward_amount REAL NOT NULL,
+            chat_value REAL NOT NULL DEFAULT 0.0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            total_messages INTEGER NOT NULL DEFAULT 0,
+            created_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            sent_date TEXT
+        )
+        ''',
+        # Частичный индекс только по ожидающим - не растет вместе с историей отправленных
+        '''
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending
+        ON notification_outbox (next_attempt_at, user_id)
+        WHERE status = 'pending'
+        ''',
+    ]),
+    (9, "Суточная сводка удаленной по сроку хранения активности", [
+        # day - номер суток с начала эпохи Unix (как в chat_activity_daily) по last_message_date;
+        # users - сколько записей (пользователей) с последним сообщением в эти сутки удалено,
+        # message_count - их накопленные сообщения
+        '''
+        CREATE TABLE IF NOT EXISTS chat_activity_archive (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            users INTEGER NOT NULL DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (10, "Суточные и недельные сводки активности чатов", [
+        # day - номер суток с начала эпохи Unix (hour / 24), week - номер недели с понедельника ((day + 3) / 7)
+        '''
+        CREATE TABLE IF NOT EXISTS chat_daily_stats (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_weekly_stats (
+            chat_id INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, week)
+        ) WITHOUT ROWID
+        ''',
+        # Пользователи, уже учтенные в active_users текущих суток и недели (старые периоды удаляются)
+        '''
+        CREATE TABLE IF NOT EXISTS chat_daily_users (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, day, user_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_weekly_users (
+            chat_id INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, week, user_id)
+        ) WITHOUT ROWID
+        ''',
+        # Заполнение по имеющимся почасовым и суточным корзинам
+        '''
+        INSERT OR REPLACE INTO chat_daily_stats (chat_id, day, message_count, active_users)
+        SELECT chat_id, day, SUM(message_count), COUNT(DISTINCT user_id)
+        FROM (
+            SELECT chat_id, hour / 24 as day, user_id, message_count FROM chat_activity_hourly
+            UNION ALL
+            SELECT chat_id, day, user_id, message_count FROM chat_activity_daily
+        )
+        GROUP BY chat_id, day
+        ''',
+        '''
+        INSERT OR REPLACE INTO chat_weekly_stats (chat_id, week, message_count, active_users)
+        SELECT chat_id, (day + 3) / 7 as week, SUM(message_count), COUNT(DISTINCT user_id)
+        FROM (
+            SELECT chat_id, hour / 24 as day, user_id, message_count FROM chat_activity_hourly
+            UNION ALL
+            SELECT chat_id, day, user_id, message_count FROM chat_activity_daily
+        )
+        GROUP BY chat_id, week
+        ''',
+        # Почасовые корзины хранятся дольше недели, поэтому покрывают текущие сутки и неделю целиком
+        '''
+        INSERT OR IGNORE INTO chat_daily_users (chat_id, day, user_id)
+        SELECT DISTINCT chat_id, hour / 24, user_id FROM chat_activity_hourly
+        WHERE hour / 24 >= CAST(strftime('%s', 'now') AS INTEGER) / 86400 - 1
+        ''',
+        '''
+        INSERT OR IGNORE INTO chat_weekly_users (chat_id, week, user_id)
+        SELECT DISTINCT chat_id, (hour / 24 + 3) / 7, user_id FROM chat_activity_hourly
+        WHERE (hour / 24 + 3) / 7 >= (CAST(strftime('%s', 'now') AS INTEGER) / 86400 + 3) / 7 - 1
+        ''',
+        # Новый пользователь периода увеличивает active_users (повторная вставка игнорируется и не срабатывает)
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_daily_users_insert
+        AFTER INSERT ON chat_daily_users
+        BEGIN
+            UPDATE chat_daily_stats SET active_users = active_users + 1
+            WHERE chat_id = NEW.chat_id AND day = NEW.day;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_weekly_users_insert
+        AFTER INSERT ON chat_weekly_users
+        BEGIN
+            UPDATE chat_weekly_stats SET active_users = active_users + 1
+            WHERE chat_id = NEW.chat_id AND week = NEW.week;
+        END
+        ''',
+    ]),
+    (11, "Счетчики строк таблиц, поддерживаемые триггерами", [
+        # first_date / last_date - самая ранняя и поздняя дата добавления строки (для users, chats, rewards)
+        '''
+        CREATE TABLE IF NOT EXISTS table_stats (
+            table_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            first_date TEXT,
+            last_date TEXT
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR REPLACE INTO table_stats (table_name, row_count, first_date, last_date)
+        SELECT 'users', COUNT(*), MIN(registration_date), MAX(registration_date) FROM users
+        UNION ALL
+        SELECT 'chats', COUNT(*), MIN(added_date), MAX(added_date) FROM chats
+        UNION ALL
+        SELECT 'rewards', COUNT(*), MIN(reward_date), MAX(reward_date) FROM rewards
+        UNION ALL
+        SELECT 'chat_activity', COUNT(*), NULL, NULL FROM chat_activity
+        ''',
+        # users и chats пишутся через INSERT OR IGNORE / INSERT OR REPLACE: строка считается
+        # новой до вставки, только если ее еще нет (замена существующей не меняет количество)
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_count_insert
+        BEFORE INSERT ON users
+        WHEN NOT EXISTS (SELECT 1 FROM users WHERE user_id = NEW.user_id)
+        BEGIN
+            UPDATE table_stats SET
+                row_count = row_count + 1,
+                first_date = MIN(COALESCE(first_date, NEW.registration_date), NEW.registration_date),
+                last_date = MAX(COALESCE(last_date, NEW.registration_date), NEW.registration_date)
+            WHERE table_name = 'users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chats_count_insert
+        BEFORE INSERT ON chats
+        WHEN NOT EXISTS (SELECT 1 FROM chats WHERE chat_id = NEW.chat_id)
+        BEGIN
+            UPDATE table_stats SET
+                row_count = row_count + 1,
+                first_date = MIN(COALESCE(first_date, NEW.added_date), NEW.added_date),
+                last_date = MAX(COALESCE(last_date, NEW.added_date), NEW.added_date)
+            WHERE table_name = 'chats';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_rewards_count_insert
+        AFTER INSERT ON rewards
+        BEGIN
+            UPDATE table_stats SET
+                row_count = row_count + 1,
+                first_date = MIN(COALESCE(first_date, NEW.reward_date), NEW.reward_date),
+                last_date = MAX(COALESCE(last_date, NEW.reward_date), NEW.reward_date)
+            WHERE table_name = 'rewards';
+        END
+        ''',
+        # chat_activity обновляется через UPSERT: при обновлении существующей строки AFTER INSERT не срабатывает
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_activity_count_insert
+        AFTER INSERT ON chat_activity
+        BEGIN
+            UPDATE table_stats SET row_count = row_count + 1 WHERE table_name = 'chat_activity';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_count_delete
+        AFTER DELETE ON users
+        BEGIN
+            UPDATE table_stats SET row_count = row_count - 1 WHERE table_name = 'users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chats_count_delete
+        AFTER DELETE ON chats
+        BEGIN
+            UPDATE table_stats SET row_count = row_count - 1 WHERE table_name = 'chats';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_rewards_count_delete
+        AFTER DELETE ON rewards
+        BEGIN
+            UPDATE table_stats SET row_count = row_count - 1 WHERE table_name = 'rewards';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_activity_count_delete
+        AFTER DELETE ON chat_activity
+        BEGIN
+            UPDATE table_stats SET row_count = row_count - 1 WHERE table_name = 'chat_activity';
+        END
+        ''',
+    ]),
+    (12, "Удаление неиспользуемого индекса chat_activity по чату и дате", [
+        # Статистика чатов читается из почасовых корзин, а выборки chat_activity по дате
+        # (инкрементальный экспорт, проверка здоровья) не фильтруют по chat_id - индекс
+        # только замедлял запись активности
+        '''
+        DROP INDEX IF EXISTS idx_chat_activity_chat_date
+        ''',
+    ]),
+    (13, "Порядковый номер изменения строк для инкрементального экспорта", [
+        # Запись в SQLite выполняется одной транзакцией за раз, поэтому номер, выданный внутри
+        # транзакции, растет в порядке фиксации (в отличие от дат, которые вычисляются до записи:
+        # строка с более ранней датой может быть зафиксирована уже после экспорта)
+        '''
+        CREATE TABLE IF NOT EXISTS change_sequence (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO change_sequence (id, value) VALUES (1, 0)
+        ''',
+        '''
+        ALTER TABLE users ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0
+        ''',
+        '''
+        ALTER TABLE chats ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0
+        ''',
+        '''
+        ALTER TABLE chat_activity ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0
+        ''',
+        # Обновление change_seq самим триггером не запускает триггер обновления повторно (WHEN).
+        # Индексы по change_seq не создаются: экспорт запускается редко, а запись идет постоянно
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_change_seq_insert
+        AFTER INSERT ON users
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            UPDATE users SET change_seq = (SELECT value FROM change_sequence WHERE id = 1)
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_change_seq_update
+        AFTER UPDATE ON users
+        WHEN NEW.change_seq = OLD.change_seq
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            UPDATE users SET change_seq = (SELECT value FROM change_sequence WHERE id = 1)
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chats_change_seq_insert
+        AFTER INSERT ON chats
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            UPDATE chats SET change_seq = (SELECT value FROM change_sequence WHERE id = 1)
+            WHERE chat_id = NEW.chat_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chats_change_seq_update
+        AFTER UPDATE ON chats
+        WHEN NEW.change_seq = OLD.change_seq
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            UPDATE chats SET change_seq = (SELECT value FROM change_sequence WHERE id = 1)
+            WHERE chat_id = NEW.chat_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_activity_change_seq_insert
+        AFTER INSERT ON chat_activity
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            UPDATE chat_activity SET change_seq = (SELECT value FROM change_sequence WHERE id = 1)
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_activity_change_seq_update
+        AFTER UPDATE ON chat_activity
+        WHEN NEW.change_seq = OLD.change_seq
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            UPDATE chat_activity SET change_seq = (SELECT value FROM change_sequence WHERE id = 1)
+            WHERE id = NEW.id;
+        END
+        ''',
+    ]),
+]
+
+async def get_schema_version(conn: aiosqlite.Connection) -> int:
+    """Текущая версия схемы (0 - миграции не применялись)"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_date TEXT NOT NULL
+        )
+    ''')
+    cursor = await conn.execute('SELECT MAX(version) FROM schema_migrations')
+    return (await cursor.fetchone())[0] or 0
+
+async def apply_migrations(conn: aiosqlite.Connection) -> List[int]:
+    """Применение ожидающих миграций по порядку, каждая - в отдельной транзакции"""
+    current_version = await get_schema_version(conn)
+    await conn.commit()
+    applied = []
+    
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        
+        try:
+            await conn.execute('BEGIN IMMEDIATE')
+            for statement in statements:
+                await conn.execute(statement)
+            await conn.execute('''
+                INSERT INTO schema_migrations (version, description, applied_date)
+                VALUES (?, ?, ?)
+            ''', (version, description, datetime.now().isoformat()))
+            await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            logger.error(f"Ошибка применения миграции {version} ({description}): {e}")
+            raise
+        
+        applied.append(version)
+        logger.info(f"Применена миграция {version}: {description}")
+    
+    return applied
@@ -0,0 +1,192 @@
+"""
+Фоновая отправка уведомлений о вознаграждениях из очереди в базе данных
+"""
+
+import asyncio
+import html
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from api_scheduler import PRIORITY_NOTIFICATION, request_priority
+from config import (
+    NOTIFY_INTERVAL, NOTIFY_BATCH_SIZE, NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BASE, NOTIFY_RETRY_MAX
+)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения в Bot API
+MESSAGE_MAX_LENGTH = 4096
+
+# Запас под строку о не поместившихся в сообщение чатах
+_MORE_CHATS_RESERVE = 64
+
+def format_reward_digest(notifications: List[Dict]) -> str:
+    """
+    Текст одного сообщения по всем ожидающим вознаграждениям пользователя
+    
+    Длина не превышает MESSAGE_MAX_LENGTH: чаты, не поместившиеся в сообщение, сводятся
+    в одну строку с их числом и суммой.
+    """
+    if len(notifications) == 1:
+        n = notifications[0]
+        return (
+            f"🎉 <b>Получено вознаграждение!</b>\n\n"
+            f"💰 Сумма: <b>{n['reward_amount']:.2f}</b>\n"
+            f"📊 Ценность чата: <b>{n['chat_value']:.2f}</b>\n"
+            f"👥 Активных пользователей: <b>{n['active_users']}</b>\n"
+            f"💬 Сообщений за сутки: <b>{n['total_messages']}</b>\n\n"
+            f"Спасибо за добавление активного чата!"
+        )
+    
+    # Суммы по чатам в порядке первого вознаграждения
+    chats = OrderedDict()
+    for n in notifications:
+        chat = chats.setdefault(n['chat_id'], {'title': n['chat_title'], 'amount': 0.0, 'count': 0})
+        chat['amount'] += n['reward_amount']
+        chat['count'] += 1
+    
+    total = sum(n['reward_amount'] for n in notifications)
+    footer = "\nСпасибо за добавление активных чатов!"
+    text = f"🎉 <b>Получено вознаграждений: {len(notifications)}</b>\n\n"
+    text += f"💰 Общая сумма: <b>{total:.2f}</b>\n\n"
+    for shown, (chat_id, chat) in enumerate(chats.items()):
+        title = html.escape(chat['title']) if chat['title'] else f"Чат {chat_id}"
+        line = f"💬 {title}: {chat['amount']:.2f} ({chat['count']} шт.)\n"
+        if len(text) + len(line) + _MORE_CHATS_RESERVE + len(footer) > MESSAGE_MAX_LENGTH:
+            rest = list(chats.values())[shown:]
+            text += f"… и ещё чатов: {len(rest)} на сумму {sum(c['amount'] for c in rest):.2f}\n"
+            break
+        text += line
+    text += footer
+    return text
+
+class NotificationSender:
+    """
+    Отправляет уведомления из таблицы notification_outbox
+    
+    Ожидающие уведомления одного пользователя объединяются в одно сообщение. Неудачные
+    отправки повторяются с экспоненциальной задержкой, после NOTIFY_MAX_ATTEMPTS попыток,
+    если пользователь заблокировал бота или запрос отклонен как некорректный уведомления
+    помечаются как failed. От бота
+    используется только send_message, поэтому вместо него можно передать заглушку.
+    """
+    
+    def __init__(self, db: Database, bot, interval: float = NOTIFY_INTERVAL,
+                 batch_size: int = NOTIFY_BATCH_SIZE, max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+                 retry_base: float = NOTIFY_RETRY_BASE, retry_max: float = NOTIFY_RETRY_MAX):
+        self.db = db
+        self.bot = bot
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._task: Optional[asyncio.Task] = None
+        
+        # Метрики
+        self.runs = 0
+        self.messages_sent = 0
+        self.notifications_sent = 0
+        self.retries = 0
+        self.failures = 0
+        self.last_duration_ms = 0.0
+    
+    def _retry_delay(self, attempts: int) -> float:
+        """Задержка перед следующей попыткой после attempts неудачных"""
+        return min(self.retry_base * (2 ** attempts), self.retry_max)
+    
+    async def _send_digest(self, user_id: int, notifications: List[Dict]):
+        """Отправка сводного сообщения пользователю и учет результата в очереди"""
+        ids = [n['id'] for n in notifications]
+        attempts = max(n['attempts'] for n in notifications)
+        
+        try:
+            # Уведомления уступают очередь ответам на команды
+            with request_priority(PRIORITY_NOTIFICATION):
+                await self.bot.send_message(user_id, format_reward_digest(notifications), parse_mode="HTML")
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Пользователь заблокировал бота или запрос некорректен (например, "message is too long") -
+            # повторять бессмысленно
+            self.failures += 1
+            await self.db.reschedule_notifications(ids, None, str(e))
+            logger.warning(f"Пользователь {user_id} недоступен для уведомлений: {e}")
+            return
+        except Exception as e:
+            if attempts + 1 >= self.max_attempts:
+                self.failures += 1
+                await self.db.reschedule_notifications(ids, None, str(e))
+                logger.warning(f"Не удалось отправить уведомление пользователю {user_id} "
+                               f"за {attempts + 1} попыток: {e}")
+                return
+            
+            if isinstance(e, TelegramRetryAfter):
+                delay = max(float(e.retry_after), self._retry_delay(attempts))
+            else:
+                delay = self._retry_delay(attempts)
+            self.retries += 1
+            await self.db.reschedule_notifications(ids, time.time() + delay, str(e))
+            logger.warning(f"Уведомление пользователю {user_id} отложено на {delay:.0f} с: {e}")
+            return
+        
+        await self.db.mark_notifications_sent(ids)
+        self.messages_sent += 1
+        self.notifications_sent += len(ids)
+    
+    async def run_once(self) -> Dict:
+        """Один проход: выборка наступивших уведомлений и отправка по одному сообщению на пользователя"""
+        start = time.perf_counter()
+        
+        notifications = await self.db.get_due_notifications(time.time(), self.batch_size)
+        by_user: Dict[int, List[Dict]] = OrderedDict()
+        for notification in notifications:
+            by_user.setdefault(notification['user_id'], []).append(notification)
+        
+        for user_id, user_notifications in by_user.items():
+            await self._send_digest(user_id, user_notifications)
+        
+        self.runs += 1
+        self.last_duration_ms = (time.perf_counter() - start) * 1000
+        if notifications:
+            logger.info("Отправка уведомлений: %s уведомлений, %s пользователей за %.1f мс",
+                        len(notifications), len(by_user), self.last_duration_ms)
+        return self.get_metrics()
+    
+    async def _run(self):
+        """Фоновый цикл отправки"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        """Запуск отправки по расписанию"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановка отправки (неотправленные уведомления остаются в очереди)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def get_metrics(self) -> Dict:
+        """Метрики отправки"""
+        return {
+            'runs': self.runs,
+            'messages_sent': self.messages_sent,
+            'notifications_sent': self.notifications_sent,
+            'retries': self.retries,
+            'failures': self.failures,
+            'last_duration_ms': round(self.last_duration_ms, 2)
+        }
@@ -0,0 +1,100 @@
+"""
+Кэш ответов с ограниченным временем жизни для агрегатов статистики
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from config import CACHE_MAX_SIZE
+
+class ResponseCache:
+    """LRU-кэш с TTL записей и инвалидацией по тегам"""
+    
+    def __init__(self, max_size: int = CACHE_MAX_SIZE):
+        self.max_size = max(1, max_size)
+        # Отключенный кэш ничего не сохраняет (см. disable)
+        self.enabled = True
+        # key -> (момент истечения, значение, теги)
+        self._entries: OrderedDict = OrderedDict()
+        # Увеличивается при каждой инвалидации: значение, прочитанное до записи в базу,
+        # не должно попасть в кэш после нее
+        self.version = 0
+        
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Значение из кэша или None, если записи нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires, value, _ = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: Hashable, value: Any, ttl: float, tags: Iterable[str] = (), version: int = None):
+        """
+        Сохранение значения
+        
+        Args:
+            key: ключ записи
+            value: значение (не изменяется вызывающим кодом после сохранения)
+            ttl: время жизни, секунд
+            tags: теги для инвалидации при записи в базу
+            version: self.version на момент начала чтения; если с тех пор была инвалидация, значение не сохраняется
+        """
+        if not self.enabled or ttl <= 0 or (version is not None and version != self.version):
+            return
+        
+        self._entries[key] = (time.monotonic() + ttl, value, frozenset(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, *tags: str):
+        """Удаление записей с любым из указанных тегов"""
+        self.version += 1
+        self.invalidations += 1
+        tags = set(tags)
+        for key in [key for key, (_, _, entry_tags) in self._entries.items() if entry_tags & tags]:
+            del self._entries[key]
+    
+    def clear(self):
+        """Полная очистка кэша"""
+        self.version += 1
+        self._entries.clear()
+    
+    def disable(self):
+        """
+        Отключение кэша: в многопроцессном режиме запись в базу инвалидирует кэш только
+        своего процесса, и остальные отдавали бы данные чужих чатов с задержкой до TTL
+        """
+        self.enabled = False
+        self.clear()
+    
+    def get_metrics(self) -> Dict:
+        """Метрики кэша"""
+        requests = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 3) if requests else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
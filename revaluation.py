@@ -0,0 +1,96 @@
+"""
+Периодическая переоценка ценности всех чатов
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from config import REVALUATION_INTERVAL
+from database import Database
+from chat_analyzer import ChatAnalyzer
+
+logger = logging.getLogger(__name__)
+
+class RevaluationJob:
+    """Пересчитывает ценность всех чатов пакетно, в том числе тихих, по расписанию"""
+    
+    def __init__(self, db: Database, analyzer: ChatAnalyzer, interval: float = REVALUATION_INTERVAL,
+                 activity_window=None):
+        self.db = db
+        self.analyzer = analyzer
+        self.interval = interval
+        # Окна активности в памяти (ActivityWindow), в которых нужно обновить ценности
+        self.activity_window = activity_window
+        self._task: Optional[asyncio.Task] = None
+        
+        # Метрики последнего запуска
+        self.runs = 0
+        self.last_duration_ms = 0.0
+        self.last_chats_processed = 0
+        self.last_chats_updated = 0
+    
+    async def run_once(self) -> Dict:
+        """Один проход: статистика всех чатов -> пакетная оценка -> запись одной транзакцией"""
+        start = time.perf_counter()
+        
+        rows = await self.db.get_all_chats_stats()
+        updates = []
+        if rows:
+            chat_ids, active_users, total_messages, member_count, current_values = zip(*rows)
+            values = self.analyzer.calculate_chat_values(active_users, total_messages, member_count)
+            
+            updates = [
+                (value, chat_id)
+                for chat_id, value, current in zip(chat_ids, values.tolist(), current_values)
+                if value != current
+            ]
+            if updates and not await self.db.update_chat_values(updates):
+                raise RuntimeError("не удалось записать новые ценности чатов")
+            
+            if self.activity_window is not None:
+                for value, chat_id in updates:
+                    self.activity_window.set_chat_info(chat_id, value=value)
+        
+        self.runs += 1
+        self.last_duration_ms = (time.perf_counter() - start) * 1000
+        self.last_chats_processed = len(rows)
+        self.last_chats_updated = len(updates)
+        
+        logger.info(f"Переоценка чатов: обработано {len(rows)}, изменено {len(updates)} "
+                    f"за {self.last_duration_ms:.1f} мс")
+        return self.get_metrics()
+    
+    async def _run(self):
+        """Фоновый цикл переоценки"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка переоценки чатов: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        """Запуск переоценки по расписанию"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановка переоценки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def get_metrics(self) -> Dict:
+        """Метрики последнего запуска"""
+        return {
+            'runs': self.runs,
+            'last_duration_ms': round(self.last_duration_ms, 2),
+            'last_chats_processed': self.last_chats_processed,
+            'last_chats_updated': self.last_chats_updated
+        }
@@ -13,6 +13,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from bot import main
+from logging_setup import setup_logging as setup_queue_logging, shutdown_logging
 
 def setup_logging():
     """Настройка логирования"""
@@ -20,15 +21,8 @@ def setup_logging():
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
     
-    # Настраиваем логирование
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_dir / 'bot.log', encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    # Настраиваем логирование через очередь: запись в файл (с ротацией) - в фоновом потоке
+    setup_queue_logging(str(log_dir / 'bot.log'))
     
     # Настраиваем логирование для aiogram
     logging.getLogger('aiogram').setLevel(logging.WARNING)
@@ -70,6 +64,8 @@ def main_wrapper():
     except Exception as e:
         logger.error(f"💥 Критическая ошибка: {e}")
         sys.exit(1)
+    finally:
+        shutdown_logging()
 
 if __name__ == "__main__":
     main_wrapper()
\ No newline at end of file
@@ -0,0 +1,387 @@
+"""
+Многопроцессный режим: входной процесс принимает обновления и распределяет их
+по рабочим процессам по chat_id
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientTimeout, web
+from aiogram import Bot, Dispatcher
+
+from config import (
+    API_GLOBAL_RATE, SHARD_QUEUE_SIZE, SHARD_STATS_INTERVAL, SHARD_SHUTDOWN_TIMEOUT,
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_MAX_CONNECTIONS
+)
+from logging_setup import setup_worker_logging, start_worker_log_forwarding
+
+logger = logging.getLogger(__name__)
+
+# Ключи обновлений, содержащие объект chat
+_CHAT_UPDATE_KEYS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'my_chat_member', 'chat_member', 'chat_join_request'
+)
+
+# Сколько секунд ждать новых обновлений в getUpdates
+_POLL_TIMEOUT = 30
+
+# Как часто рабочий процесс проверяет запрос остановки, ожидая обновления, секунд
+_WORKER_GET_TIMEOUT = 0.5
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """Номер рабочего процесса для чата (все обновления чата обрабатывает один процесс)"""
+    return chat_id % workers
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """chat_id сырого обновления (для обновлений без чата - ID пользователя)"""
+    for key in _CHAT_UPDATE_KEYS:
+        if key in update:
+            return update[key]['chat']['id']
+    
+    callback_query = update.get('callback_query')
+    if callback_query is not None:
+        message = callback_query.get('message')
+        return message['chat']['id'] if message else callback_query['from']['id']
+    
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return 0
+
+def aggregate_stats(worker_stats: List[Dict]) -> Dict:
+    """Сводка метрик рабочих процессов: счетчики суммируются, задержки (*_ms) - максимум"""
+    total: Dict[str, Any] = {}
+    for stats in worker_stats:
+        for key, value in stats.items():
+            if key == 'worker':
+                continue
+            if isinstance(value, dict):
+                total[key] = aggregate_stats([total.get(key, {}), value])
+            elif isinstance(value, (int, float)):
+                if key.endswith('_ms'):
+                    total[key] = max(total.get(key, 0), value)
+                else:
+                    total[key] = total.get(key, 0) + value
+    return total
+
+async def _run_worker(index: int, workers: int, updates: multiprocessing.Queue, stats: multiprocessing.Queue):
+    """Обработка обновлений своей доли чатов с собственными соединениями и состоянием в памяти"""
+    import bot as app
+    
+    loop = asyncio.get_running_loop()
+    processed = 0
+    failed = 0
+    tasks = set()
+    # chat_id -> (блокировка, число ожидающих обновлений): обновления чата обрабатываются по порядку
+    chat_locks: Dict[int, list] = {}
+    
+    def report(final: bool = False):
+        worker_stats = {
+            'worker': index,
+            'updates_processed': processed,
+            'updates_failed': failed,
+            'in_flight': len(tasks),
+            'activity_buffer': app.activity_buffer.get_metrics(),
+            'analysis': app.analysis_scheduler.get_metrics(),
+            'api': {
+                'granted': app.api_scheduler.granted,
+                'retry_after': app.api_scheduler.retry_after_count,
+                'queue_depth': app.api_scheduler.queue_depth
+            },
+            'cache': {key: value for key, value in app.db.cache.get_metrics().items() if key not in ('hit_rate', 'enabled')}
+        }
+        stats.put((index, final, worker_stats))
+    
+    async def handle(chat_id: int, update: Dict):
+        nonlocal processed, failed
+        entry = chat_locks.get(chat_id)
+        if entry is None:
+            entry = chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await app.dp.feed_raw_update(app.bot, update)
+                processed += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f"Ошибка обработки обновления {update.get('update_id')} в процессе {index}: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del chat_locks[chat_id]
+    
+    async def report_periodically():
+        while True:
+            await asyncio.sleep(SHARD_STATS_INTERVAL)
+            report()
+    
+    reporter = None
+    try:
+        await app.db.open()
+        # Кэш ответов не инвалидируется записями других процессов - статистика читается из базы
+        app.db.cache.disable()
+        # Общий лимит Bot API делится между процессами
+        app.api_scheduler.set_global_rate(API_GLOBAL_RATE / workers)
+        # Фоновые задачи по всем чатам (переоценка, уведомления, свертка, резервные копии) выполняет только процесс 0
+        await app.start_services(
+            background_jobs=index == 0,
+            chat_filter=lambda chat_id: shard_for(chat_id, workers) == index
+        )
+        reporter = asyncio.create_task(report_periodically())
+        logger.info(f"Рабочий процесс {index} запущен")
+        
+        # SIGTERM (systemd, docker stop) получает вся группа процессов: рабочий процесс
+        # дообрабатывает уже переданные ему обновления и останавливается со сбросом буферов,
+        # даже если входной процесс не успел прислать сигнал остановки
+        stopping = False
+        
+        def request_stop():
+            nonlocal stopping
+            stopping = True
+        
+        loop.add_signal_handler(signal.SIGTERM, request_stop)
+        while True:
+            try:
+                item = await loop.run_in_executor(None, updates.get, True, _WORKER_GET_TIMEOUT)
+            except queue.Empty:
+                if stopping:
+                    break
+                continue
+            if item is None:
+                break
+            chat_id, update = item
+            task = asyncio.create_task(handle(chat_id, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        
+        # Дожидаемся уже принятых обновлений
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await app.stop_services()
+        report(final=True)
+        logger.info(f"Рабочий процесс {index} остановлен: обработано {processed}, ошибок {failed}")
+
+def _worker_process(index: int, workers: int, updates: multiprocessing.Queue,
+                    stats: multiprocessing.Queue, log_queue: multiprocessing.Queue):
+    """Точка входа рабочего процесса"""
+    # Остановкой управляет входной процесс (Ctrl+C приходит всей группе процессов);
+    # SIGINT игнорируется с момента запуска (см. ShardRouter.start)
+    setup_worker_logging(log_queue)
+    asyncio.run(_run_worker(index, workers, updates, stats))
+
+class ShardRouter:
+    """Запуск рабочих процессов, распределение обновлений и сбор их метрик"""
+    
+    def __init__(self, workers: int, queue_size: int = SHARD_QUEUE_SIZE):
+        self.workers = workers
+        context = multiprocessing.get_context('spawn')
+        self._updates = [context.Queue(queue_size) for _ in range(workers)]
+        self._stats = context.Queue()
+        self._log_queue = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_worker_process,
+                args=(index, workers, self._updates[index], self._stats, self._log_queue),
+                name=f"reward-bot-worker-{index}",
+                daemon=True
+            )
+            for index in range(workers)
+        ]
+        self._log_listener = None
+        self._stats_task: Optional[asyncio.Task] = None
+        self.worker_stats: Dict[int, Dict] = {}
+        self.routed = 0
+    
+    def start(self):
+        """Запуск рабочих процессов"""
+        self._log_listener = start_worker_log_forwarding(self._log_queue)
+        # Игнорирование сигналов наследуется порожденным процессом: до установки собственных
+        # обработчиков (импорт модулей, открытие БД) рабочий процесс не завершается по SIGTERM
+        # действием по умолчанию, а останавливается по сигналу остановки от входного процесса
+        previous = {signum: signal.signal(signum, signal.SIG_IGN) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for process in self._processes:
+                process.start()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self._stats_task = asyncio.create_task(self._collect_stats())
+        logger.info(f"Запущено рабочих процессов: {self.workers}")
+    
+    async def route(self, update: Dict[str, Any]):
+        """Передача обновления процессу его чата (ожидает, если очередь процесса заполнена)"""
+        chat_id = update_chat_id(update)
+        worker_queue = self._updates[shard_for(chat_id, self.workers)]
+        item = (chat_id, update)
+        try:
+            worker_queue.put_nowait(item)
+        except queue.Full:
+            # Обратное давление: не принимаем новые обновления, пока процесс не разгрузится
+            await asyncio.get_running_loop().run_in_executor(None, worker_queue.put, item)
+        self.routed += 1
+    
+    async def _collect_stats(self):
+        """Прием метрик от рабочих процессов"""
+        loop = asyncio.get_running_loop()
+        last_log = time.monotonic()
+        while True:
+            try:
+                index, _, stats = await loop.run_in_executor(None, self._stats.get, True, 1.0)
+                self.worker_stats[index] = stats
+            except queue.Empty:
+                pass
+            if time.monotonic() - last_log >= SHARD_STATS_INTERVAL and self.worker_stats:
+                last_log = time.monotonic()
+                logger.info(f"Метрики рабочих процессов: {self.get_stats()}")
+    
+    def get_stats(self) -> Dict:
+        """Метрики, просуммированные по всем рабочим процессам"""
+        stats = aggregate_stats(list(self.worker_stats.values()))
+        stats['workers'] = self.workers
+        stats['workers_alive'] = sum(process.is_alive() for process in self._processes)
+        stats['updates_routed'] = self.routed
+        return stats
+    
+    async def stop(self, timeout: float = SHARD_SHUTDOWN_TIMEOUT):
+        """Остановка: процессы дообрабатывают принятые обновления и сбрасывают буферы"""
+        loop = asyncio.get_running_loop()
+        for worker_queue in self._updates:
+            await loop.run_in_executor(None, worker_queue.put, None)
+        
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Процесс {process.name} не остановился за {timeout} с, завершаем принудительно")
+                process.terminate()
+        
+        # Итоговые метрики, отправленные процессами при остановке
+        while True:
+            try:
+                index, _, stats = self._stats.get_nowait()
+                self.worker_stats[index] = stats
+            except queue.Empty:
+                break
+        
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            try:
+                await self._stats_task
+            except asyncio.CancelledError:
+                pass
+        if self._log_listener is not None:
+            self._log_listener.stop()
+        logger.info(f"Рабочие процессы остановлены, итоговые метрики: {self.get_stats()}")
+
+async def _get_raw_updates(bot: Bot, offset: Optional[int], allowed_updates: List[str]) -> Dict[str, Any]:
+    """
+    Вызов getUpdates через сессию бота без построения моделей aiogram
+    
+    Входной процесс читает из обновления только update_id и chat_id, поэтому JSON разбирается
+    один раз, а модели строит рабочий процесс (как и при приеме через webhook).
+    
+    Returns:
+        ответ Bot API как есть: {'ok': True, 'result': [...]} или описание ошибки
+    """
+    session = await bot.session.create_session()
+    payload: Dict[str, Any] = {'timeout': _POLL_TIMEOUT, 'allowed_updates': allowed_updates}
+    if offset is not None:
+        payload['offset'] = offset
+    url = bot.session.api.api_url(token=bot.token, method='getUpdates')
+    async with session.post(url, json=payload, timeout=ClientTimeout(total=_POLL_TIMEOUT + 10)) as response:
+        return await response.json(loads=bot.session.json_loads, content_type=None)
+
+async def _poll_updates(router: ShardRouter, bot: Bot, dp: Dispatcher):
+    """Long polling во входном процессе без обработки обновлений"""
+    await bot.delete_webhook()
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while True:
+        try:
+            response = await _get_raw_updates(bot, offset, allowed_updates)
+        except Exception as e:
+            logger.error(f"Ошибка получения обновлений: {e}")
+            await asyncio.sleep(5)
+            continue
+        
+        if not response.get('ok'):
+            retry_after = (response.get('parameters') or {}).get('retry_after')
+            if retry_after:
+                await asyncio.sleep(retry_after)
+            else:
+                logger.error(f"Ошибка получения обновлений: {response.get('description')}")
+                await asyncio.sleep(5)
+            continue
+        
+        for update in response['result']:
+            await router.route(update)
+            offset = update['update_id'] + 1
+
+async def _serve_webhook(router: ShardRouter, bot: Bot, dp: Dispatcher):
+    """Прием webhook во входном процессе: проверка секрета и передача обновления рабочему процессу"""
+    async def handle(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token", "") != WEBHOOK_SECRET:
+            return web.Response(body="Unauthorized", status=401)
+        await router.route(await request.json())
+        return web.json_response({})
+    
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    try:
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook {WEBHOOK_URL} зарегистрирован, сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def run_sharded(bot: Bot, dp: Dispatcher, workers: int):
+    """
+    Запуск многопроцессного режима
+    
+    Схема базы данных должна быть актуальной до вызова (миграции применяет входной процесс).
+    Работает до отмены или сигнала SIGTERM/SIGINT, после чего останавливает рабочие процессы.
+    """
+    router = ShardRouter(workers)
+    router.start()
+    
+    # SIGTERM и SIGINT прекращают прием обновлений, после чего рабочие процессы
+    # останавливаются штатно (как при остановке dp.start_polling)
+    loop = asyncio.get_running_loop()
+    receive = asyncio.create_task(
+        _serve_webhook(router, bot, dp) if WEBHOOK_URL else _poll_updates(router, bot, dp)
+    )
+    signalled = []
+    
+    def request_stop(signum: int):
+        signalled.append(signum)
+        receive.cancel()
+    
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, request_stop, signum)
+    try:
+        await receive
+    except asyncio.CancelledError:
+        if not signalled:
+            raise
+        logger.info(f"Получен сигнал {signal.Signals(signalled[0]).name}, остановка рабочих процессов...")
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        await router.stop()
@@ -0,0 +1,57 @@
+"""
+Общие заглушки и фикстуры тестов
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import aiosqlite
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram.methods import SendMessage
+
+from database import Database
+
+class FakeBot:
+    """Заглушка Bot для NotificationSender: запоминает сообщения, ошибки задаются по пользователям"""
+    
+    def __init__(self, failures: dict = None):
+        # user_id -> список фабрик исключений, по одной на попытку (пустой список - успешная отправка)
+        self.failures = failures or {}
+        self.messages = []
+    
+    async def send_message(self, chat_id, text, parse_mode=None):
+        errors = self.failures.get(chat_id)
+        if errors:
+            raise errors.pop(0)(SendMessage(chat_id=chat_id, text=text))
+        self.messages.append((chat_id, text))
+        return True
+
+async def fetch_all(db: Database, query: str, params: tuple = ()) -> list:
+    """Чтение строк отдельным соединением, минуя пул и кэш Database"""
+    async with aiosqlite.connect(db.db_path) as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchall()
+
+@pytest.fixture
+def run_with_db(tmp_path):
+    """
+    Запуск сценария с инициализированной базой во временном каталоге
+    
+    Пул соединений привязан к циклу событий, поэтому база открывается и закрывается
+    в том же asyncio.run, что и сценарий: run_with_db(scenario) выполняет await scenario(db).
+    """
+    def run(scenario):
+        async def main():
+            db = Database(str(tmp_path / "bot.db"))
+            await db.init_db()
+            try:
+                return await scenario(db)
+            finally:
+                await db.close()
+        return asyncio.run(main())
+    return run
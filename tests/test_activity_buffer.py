@@ -0,0 +1,70 @@
+"""
+Тесты повтора и отбрасывания неудачных пакетов ActivityBuffer
+"""
+
+import asyncio
+from datetime import datetime
+
+from activity_buffer import ActivityBuffer
+
+class FailingDatabase:
+    """Заглушка Database: первые failures вызовов apply_activity_batch завершаются неудачей"""
+    
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.batches = []
+    
+    async def apply_activity_batch(self, activity, chat_dates, buckets):
+        if self.failures:
+            self.failures -= 1
+            return False
+        self.batches.append(sorted((chat_id, user_id, count) for chat_id, user_id, count, _ in activity))
+        return True
+
+MOMENT = datetime(2026, 1, 1, 12, 0)
+
+def test_failed_batch_is_retried_before_new_data():
+    db = FailingDatabase(failures=2)
+    buffer = ActivityBuffer(db, max_attempts=5)
+    
+    async def scenario():
+        buffer.record(-1, 1, MOMENT)
+        buffer.record(-1, 1, MOMENT)
+        assert await buffer.flush() == 0
+        # Новые данные ждут, пока не запишется неудачный пакет
+        buffer.record(-2, 2, MOMENT)
+        assert await buffer.flush() == 0
+        assert buffer.get_metrics()['retry_attempts'] == 2
+        assert await buffer.flush() == 2
+    
+    asyncio.run(scenario())
+    
+    assert db.batches == [[(-1, 1, 2)], [(-2, 2, 1)]]
+    metrics = buffer.get_metrics()
+    assert metrics['failed_flushes'] == 2
+    assert metrics['retry_rows'] == 0
+    assert metrics['dropped_batches'] == 0
+
+def test_batch_is_dropped_after_max_attempts():
+    max_attempts = 3
+    db = FailingDatabase(failures=max_attempts)
+    buffer = ActivityBuffer(db, max_attempts=max_attempts)
+    
+    async def scenario():
+        buffer.record(-1, 1, MOMENT)
+        buffer.record(-1, 2, MOMENT)
+        for _ in range(max_attempts - 1):
+            await buffer.flush()
+        assert buffer.get_metrics()['retry_rows'] == 2
+        # Последняя попытка отбрасывает пакет, и новые данные записываются в том же сбросе
+        buffer.record(-2, 3, MOMENT)
+        assert await buffer.flush() == 1
+    
+    asyncio.run(scenario())
+    
+    assert db.batches == [[(-2, 3, 1)]]
+    metrics = buffer.get_metrics()
+    assert metrics['dropped_batches'] == 1
+    assert metrics['dropped_rows'] == 2
+    assert metrics['retry_rows'] == 0
+    assert metrics['buffer_depth'] == 0
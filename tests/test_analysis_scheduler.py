@@ -0,0 +1,40 @@
+"""
+Тесты AnalysisScheduler: интервал между анализами чата и очистка отметок
+"""
+
+import asyncio
+import time
+
+from analysis_scheduler import AnalysisScheduler
+
+def test_expired_last_runs_are_evicted():
+    min_interval = 0.1
+    runs = []
+    
+    async def analyze(chat_id):
+        runs.append((chat_id, time.monotonic()))
+    
+    async def scenario():
+        scheduler = AnalysisScheduler(analyze, min_interval=min_interval)
+        for chat_id in range(100):
+            scheduler.mark_dirty(chat_id)
+        await asyncio.sleep(0.02)
+        assert scheduler.get_metrics()['tracked_chats'] == 100
+        
+        # Повторная отметка в пределах интервала ждет его окончания
+        scheduler.mark_dirty(0)
+        await asyncio.sleep(min_interval * 1.5)
+        # По истечении интервала отметки остальных чатов удаляются при следующей отметке
+        scheduler.mark_dirty(1)
+        await asyncio.sleep(0.02)
+        metrics = scheduler.get_metrics()
+        await scheduler.stop()
+        return metrics
+    
+    metrics = asyncio.run(scenario())
+    
+    first_runs = {chat_id: at for chat_id, at in runs[:100]}
+    [(_, rerun_at)] = [(chat_id, at) for chat_id, at in runs[100:] if chat_id == 0]
+    assert rerun_at - first_runs[0] >= min_interval
+    assert metrics['runs'] == 102
+    assert metrics['tracked_chats'] == 2
@@ -0,0 +1,108 @@
+"""
+Тесты ApiScheduler и RateLimitMiddleware на имитации Bot API с ответами 429
+"""
+
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from api_scheduler import (
+    ApiScheduler, RateLimitMiddleware, PRIORITY_ADMIN, PRIORITY_NOTIFICATION, request_priority
+)
+from benchmarks import FakeTelegramApi
+
+async def send(middleware: RateLimitMiddleware, make_request, chat_id: int, priority: int = PRIORITY_NOTIFICATION):
+    """Отправка сообщения через планировщик с указанным приоритетом"""
+    with request_priority(priority):
+        return await middleware(make_request, None, SendMessage(chat_id=chat_id, text="тест"))
+
+def test_scheduler_stays_within_limits():
+    rate = 50.0
+    chat_rate = 10.0
+    requests = 60
+    
+    async def scenario():
+        api = FakeTelegramApi(rate, chat_rate, latency=0.001)
+        scheduler = ApiScheduler(global_rate=rate, chat_rate=chat_rate, group_rate=chat_rate)
+        middleware = RateLimitMiddleware(scheduler)
+        # По 10 сообщений в 6 чатов: упираются и в общий лимит, и в лимит чата
+        await asyncio.gather(*(send(middleware, api.make_request, 1 + i % 6) for i in range(requests)))
+        metrics = scheduler.get_metrics()
+        await scheduler.stop()
+        return api, metrics
+    
+    api, metrics = asyncio.run(scenario())
+    
+    assert api.rejected == 0
+    assert api.sent == requests
+    assert metrics['granted'] == requests
+    assert metrics['retry_after'] == 0
+
+def test_admin_requests_are_served_before_notifications():
+    order = []
+    
+    async def scenario():
+        api = FakeTelegramApi(global_rate=20.0, chat_rate=1.0, latency=0.001)
+        scheduler = ApiScheduler(global_rate=20.0, chat_rate=1.0, group_rate=1.0)
+        middleware = RateLimitMiddleware(scheduler)
+        
+        async def make_request(bot, method):
+            order.append(method.chat_id)
+            return await api.make_request(bot, method)
+        
+        # Уведомления поставлены в очередь раньше ответов администратору
+        notifications = [send(middleware, make_request, chat_id) for chat_id in range(100, 110)]
+        admin = [send(middleware, make_request, chat_id, PRIORITY_ADMIN) for chat_id in range(1, 4)]
+        await asyncio.gather(*notifications, *admin)
+        await scheduler.stop()
+        return api
+    
+    api = asyncio.run(scenario())
+    
+    assert api.rejected == 0
+    assert order[:3] == [1, 2, 3]
+    assert sorted(order[3:]) == list(range(100, 110))
+
+def test_retry_after_pauses_only_the_chat():
+    events = []
+    
+    async def scenario():
+        # Планировщик допускает больше, чем имитация API: второй запрос в чат 1 получит 429
+        api = FakeTelegramApi(global_rate=100.0, chat_rate=1.0, latency=0.001)
+        scheduler = ApiScheduler(global_rate=100.0, chat_rate=100.0, group_rate=100.0, chat_burst=2)
+        middleware = RateLimitMiddleware(scheduler)
+        
+        async def make_request(bot, method):
+            try:
+                result = await api.make_request(bot, method)
+            except TelegramRetryAfter as e:
+                events.append((time.monotonic(), method.chat_id, e.retry_after))
+                raise
+            events.append((time.monotonic(), method.chat_id, None))
+            return result
+        
+        async def other_chat():
+            # Запрос в другой чат после 429 не ждет окончания паузы
+            while not api.rejected:
+                await asyncio.sleep(0.01)
+            await send(middleware, make_request, 2)
+        
+        await asyncio.gather(send(middleware, make_request, 1), send(middleware, make_request, 1), other_chat())
+        metrics = scheduler.get_metrics()
+        await scheduler.stop()
+        return api, metrics
+    
+    api, metrics = asyncio.run(scenario())
+    
+    rejected = [(at, retry_after) for at, chat_id, retry_after in events if retry_after is not None]
+    assert len(rejected) == 1
+    rejected_at, retry_after = rejected[0]
+    retried_at = [at for at, chat_id, result in events if chat_id == 1 and result is None][-1]
+    other_chat_at = [at for at, chat_id, _ in events if chat_id == 2][0]
+    
+    assert retried_at - rejected_at >= retry_after
+    assert other_chat_at < rejected_at + retry_after
+    assert api.sent == 3
+    assert metrics['retry_after'] == 1
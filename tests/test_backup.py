@@ -0,0 +1,65 @@
+"""
+Тесты онлайн-резервного копирования
+"""
+
+import asyncio
+import gzip
+import sqlite3
+import threading
+
+import pytest
+
+import backup
+
+@pytest.fixture
+def source_db(tmp_path):
+    """База в режиме WAL примерно на 1200 страниц"""
+    path = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE t (x TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?)", [('x' * 1000,)] * 4000)
+    conn.commit()
+    conn.close()
+    return path
+
+def test_compressed_backup_restores(source_db, tmp_path):
+    dest = str(tmp_path / "backups" / "backup_test.db.gz")
+    
+    result = asyncio.run(backup.online_backup(source_db, dest, compress=True, step_sleep=0))
+    
+    restored = tmp_path / "restored.db"
+    with gzip.open(dest, 'rb') as f:
+        restored.write_bytes(f.read())
+    conn = sqlite3.connect(str(restored))
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 4000
+    conn.close()
+    assert result['path'] == dest
+    assert list((tmp_path / "backups").iterdir()) == [tmp_path / "backups" / "backup_test.db.gz"]
+
+def test_cancel_waits_for_copy_thread(source_db, tmp_path, monkeypatch):
+    copy_finished = threading.Event()
+    copy_pages = backup._copy_pages
+    
+    def tracked_copy_pages(*args):
+        try:
+            return copy_pages(*args)
+        finally:
+            copy_finished.set()
+    
+    monkeypatch.setattr(backup, '_copy_pages', tracked_copy_pages)
+    directory = tmp_path / "backups"
+    
+    async def scenario():
+        # По странице за шаг с паузой - копирование заняло бы десятки секунд
+        task = asyncio.create_task(backup.online_backup(
+            source_db, str(directory / "backup_test.db.gz"), compress=True, pages=1, step_sleep=0.02
+        ))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return copy_finished.is_set()
+    
+    assert asyncio.run(scenario())
+    assert list(directory.iterdir()) == []
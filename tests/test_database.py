@@ -0,0 +1,36 @@
+"""
+Тесты пула соединений Database
+"""
+
+import asyncio
+import sqlite3
+
+def test_cancelled_begin_does_not_leave_write_lock(run_with_db):
+    async def scenario(db):
+        # Другой процесс держит блокировку записи - BEGIN IMMEDIATE ждет ее в потоке aiosqlite
+        other = sqlite3.connect(db.db_path, isolation_level=None, timeout=1)
+        other.execute("BEGIN IMMEDIATE")
+        
+        async def write():
+            async with db._transaction() as conn:
+                await conn.execute("UPDATE reward_summary SET reward_count = reward_count WHERE id = 1")
+        
+        task = asyncio.create_task(write())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.sleep(0.2)
+        # Отмененный BEGIN выполняется после освобождения блокировки; транзакция не должна остаться открытой
+        other.execute("ROLLBACK")
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.2)
+        
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            other.execute("ROLLBACK")
+            return True
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            other.close()
+    
+    assert run_with_db(scenario)
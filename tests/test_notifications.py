@@ -0,0 +1,168 @@
+"""
+Тесты очереди уведомлений и NotificationSender с заглушкой вместо Bot
+"""
+
+import time
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+)
+
+from conftest import FakeBot, fetch_all
+from notifications import MESSAGE_MAX_LENGTH, NotificationSender, format_reward_digest
+
+NOTIFICATION = {'chat_value': 10.0, 'active_users': 5, 'total_messages': 100}
+
+async def add_rewards(db, rewards):
+    """Чаты и вознаграждения (user_id, chat_id) с уведомлениями в очереди"""
+    for chat_id in sorted({chat_id for _, chat_id in rewards}, reverse=True):
+        await db.add_chat(chat_id, f"Чат {-chat_id}", 1)
+    for user_id, chat_id in rewards:
+        assert await db.add_reward(user_id, chat_id, 1.0, NOTIFICATION)
+
+async def outbox(db, user_id):
+    """Состояние уведомлений пользователя: (status, attempts, next_attempt_at)"""
+    return await fetch_all(db, '''
+        SELECT status, attempts, next_attempt_at FROM notification_outbox WHERE user_id = ? ORDER BY id
+    ''', (user_id,))
+
+def test_digest_groups_rewards_by_user(run_with_db):
+    bot = FakeBot()
+    
+    async def scenario(db):
+        await add_rewards(db, [(1, -1), (1, -1), (1, -2), (2, -1)])
+        sender = NotificationSender(db, bot)
+        metrics = await sender.run_once()
+        return metrics, await outbox(db, 1), await outbox(db, 2)
+    
+    metrics, user_1, user_2 = run_with_db(scenario)
+    
+    assert [user_id for user_id, _ in bot.messages] == [1, 2]
+    digest = bot.messages[0][1]
+    assert "Получено вознаграждений: 3" in digest
+    assert "Чат 1: 2.00 (2 шт.)" in digest
+    assert "Чат 2: 1.00 (1 шт.)" in digest
+    assert "Получено вознаграждение!" in bot.messages[1][1]
+    assert [status for status, _, _ in user_1 + user_2] == ['sent'] * 4
+    assert metrics['messages_sent'] == 2
+    assert metrics['notifications_sent'] == 4
+
+def test_forbidden_marks_failed_without_retry(run_with_db):
+    bot = FakeBot({1: [lambda method: TelegramForbiddenError(
+        method=method, message="Forbidden: bot was blocked by the user")]})
+    
+    async def scenario(db):
+        await add_rewards(db, [(1, -1)])
+        sender = NotificationSender(db, bot, max_attempts=5)
+        await sender.run_once()
+        await sender.run_once()
+        return sender.get_metrics(), await outbox(db, 1)
+    
+    metrics, rows = run_with_db(scenario)
+    
+    assert rows == [('failed', 1, 0)]
+    assert bot.messages == []
+    assert metrics['failures'] == 1
+    assert metrics['retries'] == 0
+
+def test_bad_request_marks_failed_without_retry(run_with_db):
+    bot = FakeBot({1: [lambda method: TelegramBadRequest(
+        method=method, message="Bad Request: message is too long")]})
+    
+    async def scenario(db):
+        await add_rewards(db, [(1, -1)])
+        await NotificationSender(db, bot, max_attempts=5).run_once()
+        return await outbox(db, 1)
+    
+    assert run_with_db(scenario) == [('failed', 1, 0)]
+
+def test_retry_after_postpones_until_allowed(run_with_db):
+    retry_after = 120
+    bot = FakeBot({1: [lambda method: TelegramRetryAfter(
+        method=method, message="Too Many Requests", retry_after=retry_after)]})
+    
+    async def scenario(db):
+        await add_rewards(db, [(1, -1)])
+        sender = NotificationSender(db, bot, retry_base=1.0)
+        started = time.time()
+        await sender.run_once()
+        # Следующий проход не отправляет уведомление раньше retry_after
+        await sender.run_once()
+        return started, sender.get_metrics(), await outbox(db, 1)
+    
+    started, metrics, rows = run_with_db(scenario)
+    
+    [(status, attempts, next_attempt_at)] = rows
+    assert (status, attempts) == ('pending', 1)
+    assert next_attempt_at >= started + retry_after
+    assert bot.messages == []
+    assert metrics['retries'] == 1
+
+def test_backoff_doubles_and_fails_after_max_attempts(run_with_db):
+    max_attempts = 3
+    retry_base = 10.0
+    bot = FakeBot({1: [lambda method: TelegramNetworkError(
+        method=method, message="Request timeout error")] * max_attempts})
+    
+    async def scenario(db):
+        await add_rewards(db, [(1, -1)])
+        sender = NotificationSender(db, bot, max_attempts=max_attempts, retry_base=retry_base)
+        delays = []
+        for _ in range(max_attempts):
+            started = time.time()
+            await sender.run_once()
+            [(status, attempts, next_attempt_at)] = await outbox(db, 1)
+            delays.append((status, attempts, round(next_attempt_at - started)))
+            # Повтор наступает сразу, не дожидаясь задержки
+            async with db._transaction() as conn:
+                await conn.execute("UPDATE notification_outbox SET next_attempt_at = 0 WHERE status = 'pending'")
+        return delays
+    
+    delays = run_with_db(scenario)
+    
+    assert delays[:2] == [('pending', 1, retry_base), ('pending', 2, retry_base * 2)]
+    assert delays[2][:2] == ('failed', max_attempts)
+    assert bot.messages == []
+
+def test_outbox_is_written_with_reward(run_with_db):
+    async def scenario(db):
+        await add_rewards(db, [(1, -1)])
+        return await fetch_all(db, '''
+            SELECT r.user_id, r.chat_id, r.reward_amount, o.reward_amount, o.chat_value, o.active_users, o.status
+            FROM rewards r JOIN notification_outbox o ON o.user_id = r.user_id AND o.chat_id = r.chat_id
+        ''')
+    
+    assert run_with_db(scenario) == [(1, -1, 1.0, 1.0, 10.0, 5, 'pending')]
+
+def test_failed_outbox_insert_rolls_back_reward(run_with_db):
+    async def scenario(db):
+        await db.add_chat(-1, "Чат 1", 1)
+        async with db._transaction() as conn:
+            await conn.execute('''
+                CREATE TRIGGER fail_outbox BEFORE INSERT ON notification_outbox
+                BEGIN SELECT RAISE(ABORT, 'outbox unavailable'); END
+            ''')
+        added = await db.add_reward(1, -1, 1.0, NOTIFICATION)
+        return added, await fetch_all(db, '''
+            SELECT
+                (SELECT COUNT(*) FROM rewards),
+                (SELECT COUNT(*) FROM users WHERE total_rewards > 0),
+                (SELECT reward_count FROM reward_summary WHERE id = 1)
+        ''')
+    
+    added, [counts] = run_with_db(scenario)
+    
+    assert not added
+    assert counts == (0, 0, 0)
+
+def test_digest_fits_message_limit():
+    notifications = [
+        {'chat_id': -chat_id, 'chat_title': '<' * 128, 'reward_amount': 1.0} for chat_id in range(1, 301)
+    ]
+    
+    digest = format_reward_digest(notifications)
+    
+    assert len(digest) <= MESSAGE_MAX_LENGTH
+    assert "Общая сумма: <b>300.00</b>" in digest
+    shown = digest.count("(1 шт.)")
+    assert f"… и ещё чатов: {300 - shown} на сумму {300 - shown:.2f}" in digest
@@ -4,12 +4,15 @@
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
+import os
+import time
 from typing import List, Dict, Optional
 import aiosqlite
 
 from database import Database
-from config import DATABASE_PATH
+from backup import default_backup_path, online_backup
+from csv_export import export_tables
+from config import DATABASE_PATH, EXPORT_DIR, VACUUM_PAGES_PER_RUN
 
 logger = logging.getLogger(__name__)
 
@@ -19,138 +22,111 @@ class BotUtils:
     def __init__(self, db: Database = None):
         self.db = db or Database(DATABASE_PATH)
     
-    async def cleanup_old_activity(self, days: int = 7):
-        """Очистка старых записей активности"""
-        try:
-            cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-            
-            async with aiosqlite.connect(DATABASE_PATH) as conn:
-                # Удаляем старые записи активности
-                cursor = await conn.execute(
-                    "DELETE FROM chat_activity WHERE last_message_date < ?",
-                    (cutoff_date,)
-                )
-                deleted_count = cursor.rowcount
-                await conn.commit()
-                
-                logger.info(f"Удалено {deleted_count} старых записей активности")
-                return deleted_count
-                
-        except Exception as e:
-            logger.error(f"Ошибка очистки старых записей: {e}")
-            return 0
+    async def cleanup_old_activity(self, days: int = 7) -> Dict:
+        """
+        Очистка старых записей активности короткими транзакциями со сводкой удаляемого
+        в chat_activity_archive (см. Database.purge_old_activity)
+        """
+        return await self.db.purge_old_activity(days)
     
-    async def backup_database(self, backup_path: str = None):
-        """Создание резервной копии базы данных"""
+    async def backup_database(self, backup_path: str = None, compress: bool = False,
+                              probe: bool = False) -> Optional[Dict]:
+        """
+        Создание резервной копии базы данных без остановки бота
+        
+        Args:
+            probe: замерять задержки записи и цикла событий во время копирования
+        
+        Returns:
+            путь к копии и метрики копирования (см. backup.online_backup) или None при ошибке
+        """
         try:
             if not backup_path:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_path = f"backup_{timestamp}.db"
+                backup_path = default_backup_path(compress=compress)
             
-            # Копируем файл базы данных
-            import shutil
-            shutil.copy2(DATABASE_PATH, backup_path)
+            result = await online_backup(DATABASE_PATH, backup_path, compress=compress, probe=probe)
             
             logger.info(f"Резервная копия создана: {backup_path}")
-            return backup_path
+            return result
             
         except Exception as e:
             logger.error(f"Ошибка создания резервной копии: {e}")
             return None
     
     async def get_database_stats(self) -> Dict:
-        """Получение статистики базы данных"""
+        """
+        Получение статистики базы данных по счетчикам строк (без COUNT(*) и сканирования дат)
+        
+        Таблицы с оценочным количеством строк (sqlite_stat1) перечислены в 'estimated'.
+        """
         try:
-            async with aiosqlite.connect(DATABASE_PATH) as conn:
-                stats = {}
-                
-                # Размер базы данных
-                import os
-                stats['file_size'] = os.path.getsize(DATABASE_PATH)
+            stats = {'file_size': os.path.getsize(DATABASE_PATH), 'estimated': []}
                 
-                # Количество записей в каждой таблице
-                tables = ['users', 'chats', 'rewards', 'chat_activity']
-                for table in tables:
-                    cursor = await conn.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = (await cursor.fetchone())[0]
-                    stats[f'{table}_count'] = count
+            table_stats = await self.db.get_table_stats()
+            for table, table_info in table_stats.items():
+                stats[f'{table}_count'] = table_info['rows'] or 0
+                if table_info['source'] != 'counter':
+                    stats['estimated'].append(table)
                 
-                # Статистика по датам
-                cursor = await conn.execute(
-                    "SELECT MIN(registration_date), MAX(registration_date) FROM users"
-                )
-                user_dates = await cursor.fetchone()
-                stats['first_user_date'] = user_dates[0]
-                stats['last_user_date'] = user_dates[1]
+            # Статистика по датам
+            stats['first_user_date'] = table_stats['users']['first_date']
+            stats['last_user_date'] = table_stats['users']['last_date']
+            stats['first_chat_date'] = table_stats['chats']['first_date']
+            stats['last_chat_date'] = table_stats['chats']['last_date']
                 
-                cursor = await conn.execute(
-                    "SELECT MIN(added_date), MAX(added_date) FROM chats"
-                )
-                chat_dates = await cursor.fetchone()
-                stats['first_chat_date'] = chat_dates[0]
-                stats['last_chat_date'] = chat_dates[1]
-                
-                return stats
+            return stats
                 
         except Exception as e:
             logger.error(f"Ошибка получения статистики БД: {e}")
             return {}
     
-    async def optimize_database(self):
-        """Оптимизация базы данных"""
+    async def optimize_database(self, convert: bool = False, pages: int = VACUUM_PAGES_PER_RUN) -> Optional[Dict]:
+        """
+        Оптимизация базы данных без полной перезаписи файла
+        
+        Выполняет PRAGMA optimize и возвращает не более pages свободных страниц
+        (Database.incremental_vacuum). При convert база предварительно переводится в режим
+        auto_vacuum=INCREMENTAL - это однократный полный VACUUM.
+        
+        Returns:
+            свободные страницы до и после, освобождено байт и длительность или None при ошибке
+        """
         try:
-            async with aiosqlite.connect(DATABASE_PATH) as conn:
-                # Анализируем базу данных
-                await conn.execute("ANALYZE")
+            result = {}
+            if convert:
+                conversion = await self.db.convert_to_incremental_vacuum()
+                result['converted_bytes'] = conversion['bytes_reclaimed']
                 
-                # Очищаем свободное место
-                await conn.execute("VACUUM")
+            start = time.perf_counter()
+            await self.db.optimize()
+            result['optimize_ms'] = round((time.perf_counter() - start) * 1000, 2)
                 
-                await conn.commit()
-                logger.info("База данных оптимизирована")
-                return True
+            result.update(await self.db.incremental_vacuum(pages))
+            info = await self.db.get_vacuum_info()
+            result['freelist_bytes'] = info['freelist_bytes']
+            result['file_size'] = info['page_count'] * info['page_size']
+            
+            logger.info(f"База данных оптимизирована: освобождено {result['bytes_reclaimed']} байт")
+            return result
                 
         except Exception as e:
             logger.error(f"Ошибка оптимизации БД: {e}")
-            return False
+            return None
     
-    async def export_data_to_csv(self, output_dir: str = "exports"):
-        """Экспорт данных в CSV файлы"""
+    async def export_data_to_csv(self, output_dir: str = EXPORT_DIR, compress: bool = False,
+                                 incremental: bool = False) -> Optional[Dict]:
+        """
+        Экспорт данных в CSV файлы (потоково, см. csv_export.export_tables)
+        
+        Returns:
+            число строк и скорость по каждой таблице или None при ошибке
+        """
         try:
-            import csv
-            import os
-            from pathlib import Path
-            
-            # Создаем директорию для экспорта
-            Path(output_dir).mkdir(exist_ok=True)
-            
-            async with aiosqlite.connect(DATABASE_PATH) as conn:
-                tables = ['users', 'chats', 'rewards', 'chat_activity']
-                
-                for table in tables:
-                    # Получаем данные из таблицы
-                    cursor = await conn.execute(f"SELECT * FROM {table}")
-                    rows = await cursor.fetchall()
-                    
-                    if rows:
-                        # Получаем названия колонок
-                        cursor = await conn.execute(f"PRAGMA table_info({table})")
-                        columns = [column[1] for column in await cursor.fetchall()]
-                        
-                        # Записываем в CSV
-                        csv_path = os.path.join(output_dir, f"{table}.csv")
-                        with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                            writer = csv.writer(csvfile)
-                            writer.writerow(columns)
-                            writer.writerows(rows)
-                        
-                        logger.info(f"Экспортировано {len(rows)} записей в {csv_path}")
-            
-            return True
+            return await export_tables(DATABASE_PATH, output_dir, compress=compress, incremental=incremental)
             
         except Exception as e:
             logger.error(f"Ошибка экспорта данных: {e}")
-            return False
+            return None
     
     async def health_check(self) -> Dict:
         """Проверка здоровья системы"""
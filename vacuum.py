@@ -0,0 +1,82 @@
+"""
+Инкрементальная очистка свободных страниц базы по расписанию
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from database import Database
+from config import VACUUM_INTERVAL, VACUUM_PAGES_PER_RUN
+
+logger = logging.getLogger(__name__)
+
+class VacuumJob:
+    """
+    Периодический PRAGMA optimize и возврат не более VACUUM_PAGES_PER_RUN свободных страниц
+    
+    Заменяет полный VACUUM: каждый проход блокирует запись на время, ограниченное числом
+    страниц. Для баз в режиме auto_vacuum, отличном от INCREMENTAL, выполняется только optimize.
+    """
+    
+    def __init__(self, db: Database, interval: float = VACUUM_INTERVAL, pages: int = VACUUM_PAGES_PER_RUN):
+        self.db = db
+        self.interval = interval
+        self.pages = pages
+        self._task: Optional[asyncio.Task] = None
+        
+        # Метрики
+        self.runs = 0
+        self.failures = 0
+        self.pages_freed = 0
+        self.bytes_reclaimed = 0
+        self.last_run: Optional[Dict] = None
+    
+    async def run_once(self) -> Dict:
+        """Обновление статистики планировщика и освобождение страниц"""
+        await self.db.optimize()
+        result = await self.db.incremental_vacuum(self.pages)
+        
+        self.runs += 1
+        self.pages_freed += result['pages_freed']
+        self.bytes_reclaimed += result['bytes_reclaimed']
+        self.last_run = result
+        if result['pages_freed']:
+            logger.info(f"Освобождено {result['pages_freed']} страниц ({result['bytes_reclaimed']} байт) "
+                        f"за {result['duration_ms']:.1f} мс, свободных страниц осталось: {result['freelist_after']}")
+        return result
+    
+    async def _run(self):
+        """Фоновый цикл очистки"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Ошибка инкрементальной очистки БД: {e}")
+    
+    def start(self):
+        """Запуск очистки по расписанию"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Остановка очистки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def get_metrics(self) -> Dict:
+        """Метрики очистки"""
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'pages_freed': self.pages_freed,
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'last_run': self.last_run
+        }
@@ -0,0 +1,120 @@
+"""
+Прием обновлений через webhook (aiohttp) как альтернатива long polling
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_ACQUIRE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик webhook с ограничением числа обновлений в обработке
+    
+    Обновление принимается (ответ 200) только после получения свободного слота, поэтому при
+    отставании обработчиков ответы Telegram задерживаются и он сам снижает темп доставки
+    (не более max_connections одновременных запросов). Если слот не освободился за
+    acquire_timeout секунд, возвращается 503 и Telegram повторит доставку позже.
+    """
+    
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str = None,
+                 max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+                 acquire_timeout: float = WEBHOOK_ACQUIRE_TIMEOUT, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token or None, **data)
+        self.max_in_flight = max_in_flight
+        self.acquire_timeout = acquire_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        
+        # Метрики
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+    
+    @property
+    def in_flight(self) -> int:
+        """Количество обновлений в обработке"""
+        return len(self._background_feed_update_tasks)
+    
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            self._slots.release()
+    
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Webhook перегружен: %s обновлений в обработке, запрос отклонен", self.in_flight)
+            return web.Response(status=503, text="Busy")
+        
+        try:
+            response = await super()._handle_request_background(bot, request)
+        except Exception:
+            self._slots.release()
+            raise
+        self.accepted += 1
+        return response
+    
+    def get_metrics(self) -> Dict:
+        """Метрики приема обновлений"""
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed
+        }
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET,
+                       max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT, **data: Any):
+    """
+    Приложение aiohttp с обработчиком webhook
+    
+    Returns:
+        (web.Application, BoundedRequestHandler)
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, secret_token=secret_token, max_in_flight=max_in_flight, **data)
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot, **data)
+    return app, handler
+
+async def run_webhook(dp: Dispatcher, bot: Bot, url: str = WEBHOOK_URL, host: str = WEBHOOK_HOST,
+                      port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET):
+    """Запуск HTTP-сервера, регистрация webhook в Telegram и ожидание до остановки"""
+    app, handler = create_webhook_app(dp, bot, path=path, secret_token=secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    
+    try:
+        await bot.set_webhook(
+            url,
+            secret_token=secret_token or None,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook {url} зарегистрирован, сервер слушает {host}:{port}{path}")
+        await asyncio.Event().wait()
+    finally:
+        logger.info(f"Остановка webhook: {handler.get_metrics()}")
+        await runner.cleanup()